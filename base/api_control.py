@@ -0,0 +1,225 @@
+from base.api_scheduler import current_job, job_priority
+import asyncio
+import collections
+import email.utils
+import random
+import time
+import httpx
+import openai
+
+
+def backoff_delay(attempt, base=1, cap=120):
+    """
+    指数退避加全抖动
+    :param attempt: 已失败的次数，从 0 开始
+    :param base: 初始退避秒数
+    :param cap: 最大退避秒数
+    :return: 本次等待秒数
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def status_code(exception):
+    """
+    从异常中取出 HTTP 状态码，没有时返回 None
+    """
+    return getattr(exception, "status_code", None)
+
+
+def retry_after(exception):
+    """
+    读取响应头中的 Retry-After（支持秒数、HTTP 日期和 retry-after-ms）
+    :return: 需要等待的秒数，没有时返回 None
+    """
+    response = getattr(exception, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0)
+
+
+def is_throttled(exception):
+    """
+    是否为限流（429）或服务端过载（503）
+    """
+    return status_code(exception) in (429, 503)
+
+
+def is_retryable(exception):
+    """
+    是否值得重试：连接错误、超时、限流和 5xx 可以重试，其余 4xx 和程序错误（TypeError、KeyError 等）直接失败
+    """
+    code = status_code(exception)
+    if code is None:
+        return isinstance(exception, (openai.APIConnectionError, httpx.TransportError, TimeoutError))
+    return code in (408, 409, 429) or code >= 500
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 并发控制器
+    请求成功时缓慢增加并发上限，遇到限流、错误率过高或延迟明显上升时成倍减小
+    等待中的请求按所属任务 Job 的优先级出队，同一任务内先到先得
+    只能在同一个事件循环中使用
+    """
+
+    def __init__(
+        self,
+        initial=8,
+        minimum=1,
+        maximum=64,
+        increase=1,
+        decrease=0.5,
+        latency_tolerance=3,
+        error_threshold=0.2,
+        window=20,
+    ):
+        """
+        :param initial: 初始并发上限
+        :param minimum: 最小并发上限
+        :param maximum: 最大并发上限
+        :param increase: 每完成约一个并发上限数量的成功请求时增加的并发数
+        :param decrease: 减小时乘以的系数
+        :param latency_tolerance: 延迟超过最低延迟的倍数时减小并发
+        :param error_threshold: 最近请求中的错误率超过该值时减小并发
+        :param window: 统计错误率的最近请求数量
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.error_threshold = error_threshold
+        self.in_flight = 0
+        self.latency = None  # 延迟的指数滑动平均
+        self.min_latency = None  # 观测到的最低延迟
+        self.resume_at = 0  # 在此时间之前暂停发送（Retry-After）
+        self._outcomes = collections.deque(maxlen=window)
+        self._last_decrease = 0
+        self._waiters = {}  # 任务 -> 等待者队列
+
+    async def acquire(self, job=None):
+        """
+        等待直到可以发送一个请求
+        :param job: 请求所属的任务，为 None 时使用 current_job
+        """
+        if job is None:
+            job = current_job.get()
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self.resume_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if self.in_flight < int(self.limit) and not self._has_priority_waiter(job):
+                self.in_flight += 1
+                return
+            waiter = loop.create_future()
+            self._waiters.setdefault(job, collections.deque()).append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # 额度已经转交给本请求，归还额度
+                    self.in_flight -= 1
+                    self._wake()
+                else:
+                    queue = self._waiters.get(job)
+                    if queue is not None and waiter in queue:
+                        queue.remove(waiter)
+                        if not queue:
+                            del self._waiters[job]
+                raise
+            # 唤醒时 _wake 已经为本请求占用了额度
+            return
+
+    def release(self, latency=None, error=False, throttled=False):
+        """
+        请求结束时调用，根据结果调整并发上限
+        :param latency: 请求耗时秒数，请求失败时可为 None
+        :param error: 请求是否失败
+        :param throttled: 是否被限流
+        """
+        self.in_flight -= 1
+        self._outcomes.append(error)
+        now = time.monotonic()
+
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if self.min_latency is None or latency < self.min_latency:
+                self.min_latency = latency
+
+        error_rate = sum(self._outcomes) / len(self._outcomes)
+        slow = (
+            latency is not None
+            and self.min_latency is not None
+            and self.latency > self.min_latency * self.latency_tolerance
+        )
+        if throttled or (error and error_rate > self.error_threshold) or slow:
+            # 每个延迟周期内最多减小一次，避免一次拥塞导致并发连续减半
+            cooldown = self.latency if self.latency is not None else 1
+            if now - self._last_decrease >= cooldown:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self._last_decrease = now
+                if slow:
+                    # 让最低延迟缓慢跟随当前水平，防止一次偶然的快速响应长期压低并发
+                    self.min_latency = (self.min_latency + self.latency) / 2
+        elif not error:
+            self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+
+        self._wake()
+
+    def pause(self, seconds):
+        """
+        在接下来的 seconds 秒内暂停发送新请求
+        """
+        loop = asyncio.get_running_loop()
+        self.resume_at = max(self.resume_at, loop.time() + seconds)
+        loop.call_later(seconds, self._wake)
+
+    def waiting(self):
+        """
+        正在排队的请求数量
+        """
+        return sum(len(queue) for queue in self._waiters.values())
+
+    def _has_priority_waiter(self, job):
+        # 是否有优先级不低于 job 的请求在排队，有则新请求不能插队
+        if not self._waiters:
+            return False
+        priority = job_priority(job)
+        return any(job_priority(other) <= priority for other in self._waiters)
+
+    def _wake(self):
+        # 按任务优先级唤醒等待者，数量不超过空余的并发额度
+        if self.resume_at > asyncio.get_running_loop().time():
+            return
+        free = int(self.limit) - self.in_flight
+        while self._waiters and free > 0:
+            job = min(self._waiters, key=job_priority)
+            queue = self._waiters[job]
+            waiter = queue.popleft()
+            if not queue:
+                del self._waiters[job]
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+                free -= 1
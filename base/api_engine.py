@@ -0,0 +1,125 @@
+from base.api_control import AdaptiveLimiter
+from openai import AsyncOpenAI
+import httpx
+import asyncio
+import threading
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    http2_available = True
+except ImportError:
+    http2_available = False
+
+
+class ApiEngine:
+    """
+    异步请求引擎
+    在后台线程中运行一个事件循环，所有请求共享同一个 AsyncOpenAI 客户端及其连接池
+    """
+
+    def __init__(
+        self,
+        api_key,
+        base_url,
+        max_connections=256,
+        max_keepalive_connections=64,
+        keepalive_expiry=60,
+        timeout=600,
+        http2=True,
+        limiter=None,
+    ):
+        """
+        :param api_key: OpenAI API密钥
+        :param base_url: API基础URL
+        :param max_connections: 连接池最大连接数
+        :param max_keepalive_connections: 最大保持连接数
+        :param keepalive_expiry: 空闲连接保持秒数
+        :param timeout: 单次请求超时秒数
+        :param http2: 是否启用 HTTP/2（需要安装 h2）
+        :param limiter: 该端点的并发控制器 AdaptiveLimiter，为 None 时使用默认参数创建
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self.limiter = limiter if limiter is not None else AdaptiveLimiter()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name=f"api_engine({base_url})", daemon=True
+        )
+        self._thread.start()
+        self.client = self.run(
+            self._create_client(
+                max_connections,
+                max_keepalive_connections,
+                keepalive_expiry,
+                timeout,
+                http2 and http2_available,
+            )
+        )
+
+    async def _create_client(
+        self, max_connections, max_keepalive_connections, keepalive_expiry, timeout, http2
+    ):
+        # httpx 客户端需要在事件循环内创建
+        http_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=timeout,
+        )
+        # 重试由 api_request 负责，关闭 SDK 自带的重试
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=http_client,
+            max_retries=0,
+        )
+
+    def in_loop(self):
+        """
+        当前线程是否为引擎的事件循环线程
+        """
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro):
+        """
+        将协程提交到引擎的事件循环
+        :return: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """
+        在引擎的事件循环中运行协程，阻塞等待结果
+        """
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("不能在引擎的事件循环线程中同步等待协程，请使用 await")
+        return self.submit(coro).result()
+
+    def close(self):
+        """
+        关闭客户端并停止事件循环
+        """
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+engines = {}
+engines_lock = threading.Lock()
+
+
+def get_engine(api_key, base_url, **kwargs):
+    """
+    获取进程内共享的请求引擎，每个 (api_key, base_url) 只创建一个
+    :param kwargs: 传给 ApiEngine 的参数，仅在首次创建时生效
+    """
+    with engines_lock:
+        engine = engines.get((api_key, base_url))
+        if engine is None:
+            engine = ApiEngine(api_key, base_url, **kwargs)
+            engines[(api_key, base_url)] = engine
+        return engine
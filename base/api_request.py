@@ -1,4 +1,8 @@
-from openai import OpenAI
+from base.api_engine import get_engine
+from base.api_control import backoff_delay, retry_after, is_throttled, is_retryable
+from base.api_scheduler import current_job, usage_tokens
+from base import metrics
+import asyncio
 import time
 import logging
 from logging.handlers import RotatingFileHandler
@@ -49,50 +53,107 @@ def setup_logger():
 logger = setup_logger()
 
 def is_valid_json(json_str):
+    # 模型可能返回空内容（None），同样视为不合法
     try:
         json.loads(json_str)
         return True
-    except ValueError:
+    except (TypeError, ValueError):
         return False
 
-def api_request(api_key, base_url, model, messages, max_retries=10, retry_delay=120):
-    client = OpenAI(
-        api_key=api_key,
-        base_url=base_url,
-    )
+async def api_request_async(api_key, base_url, model, messages, max_retries=10, retry_delay=120, backoff_base=1):
+    """
+    异步发送请求，使用共享的请求引擎和连接池
+    并发由端点的 AdaptiveLimiter 控制，失败时按指数退避加抖动重试，并遵守 Retry-After
+
+    :param retry_delay: 单次退避的最长秒数
+    :param backoff_base: 首次退避的基准秒数
+    :return: 合法的 JSON 字符串
+    """
+    engine = get_engine(api_key, base_url)
+    client = engine.client
+    limiter = engine.limiter
     for attempt in range(max_retries):
+        await limiter.acquire()
+        start = time.monotonic()
+        error = None
+        outcome = {}
         try:
             logger.info(f"第 {attempt + 1} 次尝试：正在发送请求到 API")
-            response = client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=model,
                 messages=messages,
                 response_format={"type": "json_object"},
             )
-            response_content = response.choices[0].message.content
-
-            # 检测响应是否是合法的 JSON
-            if is_valid_json(response_content):
-                logger.info("API 请求成功，且响应是合法的 JSON")
-                return response_content  # 返回 JSON 字符串
-            else:
-                logger.warning(f"第 {attempt + 1} 次尝试：响应不是合法的 JSON，正在重试...")
-                # 在 messages 中加入额外的提示信息（英文）
-                messages.append({
-                    "role": "user",
-                    "content": "Please ensure the response is a valid JSON format."
-                })
-                if attempt < max_retries - 1:
-                    logger.warning(f"{retry_delay} 秒后重试...")
-                    time.sleep(retry_delay)
-                else:
-                    logger.critical(f"API 请求失败，已达到最大重试次数 {max_retries} 次：响应不是合法的 JSON")
-                    raise Exception(f"API 请求失败，已达到最大重试次数 {max_retries} 次：响应不是合法的 JSON")
-
+            outcome = {"latency": time.monotonic() - start}
         except Exception as e:
-            logger.error(f"第 {attempt + 1} 次尝试失败：{e}")
+            error = e
+            outcome = {"error": True, "throttled": is_throttled(e)}
+        finally:
+            # 请求被取消（CancelledError）时也要归还并发名额，否则名额永久丢失
+            limiter.release(**outcome)
+        if error is not None:
+            throttled = outcome["throttled"]
+            metrics.api_seconds.observe(time.monotonic() - start, model=model, outcome="error")
+            logger.error(f"第 {attempt + 1} 次尝试失败：{error}")
+            if not is_retryable(error):
+                metrics.api_failures.inc(model=model, reason="not_retryable")
+                logger.critical(f"API 请求失败，错误不可重试：{error}")
+                raise Exception(f"API 请求失败，错误不可重试：{error}")
             if attempt < max_retries - 1:
-                logger.warning(f"{retry_delay} 秒后重试...")
-                time.sleep(retry_delay)
+                metrics.api_retries.inc(model=model, reason="throttled" if throttled else "error")
+                delay = retry_after(error)
+                if delay is not None:
+                    # 服务端给出了等待时间，整个端点暂停发送
+                    logger.warning(f"服务端要求 {delay:.1f} 秒后重试")
+                    limiter.pause(delay)
+                else:
+                    delay = backoff_delay(attempt, backoff_base, retry_delay)
+                    logger.warning(f"{delay:.1f} 秒后重试...")
+                await asyncio.sleep(delay)
+                continue
             else:
+                metrics.api_failures.inc(model=model, reason="max_retries")
                 logger.critical(f"API 请求失败，已达到最大重试次数 {max_retries} 次")
-                raise Exception(f"API 请求失败，已达到最大重试次数 {max_retries} 次")
\ No newline at end of file
+                raise Exception(f"API 请求失败，已达到最大重试次数 {max_retries} 次")
+        elapsed = outcome["latency"]
+        # 用量计入当前任务
+        job = current_job.get()
+        if job is not None:
+            job.usage.add(response.usage, elapsed)
+        prompt_tokens, completion_tokens, cached_tokens = usage_tokens(response.usage)
+        metrics.llm_tokens.inc(prompt_tokens, model=model, kind="prompt")
+        metrics.llm_tokens.inc(completion_tokens, model=model, kind="completion")
+        metrics.llm_tokens.inc(cached_tokens, model=model, kind="cached")
+        response_content = response.choices[0].message.content if response.choices else None
+
+        # 检测响应是否是合法的 JSON
+        if is_valid_json(response_content):
+            metrics.api_seconds.observe(elapsed, model=model, outcome="ok")
+            logger.info("API 请求成功，且响应是合法的 JSON")
+            return response_content  # 返回 JSON 字符串
+        else:
+            metrics.api_seconds.observe(elapsed, model=model, outcome="invalid_json")
+            logger.warning(f"第 {attempt + 1} 次尝试：响应不是合法的 JSON，正在重试...")
+            # 在 messages 中加入额外的提示信息（英文）
+            messages.append({
+                "role": "user",
+                "content": "Please ensure the response is a valid JSON format."
+            })
+            if attempt < max_retries - 1:
+                metrics.api_retries.inc(model=model, reason="invalid_json")
+                delay = backoff_delay(attempt, backoff_base, retry_delay)
+                logger.warning(f"{delay:.1f} 秒后重试...")
+                await asyncio.sleep(delay)
+            else:
+                metrics.api_failures.inc(model=model, reason="invalid_json")
+                logger.critical(f"API 请求失败，已达到最大重试次数 {max_retries} 次：响应不是合法的 JSON")
+                raise Exception(f"API 请求失败，已达到最大重试次数 {max_retries} 次：响应不是合法的 JSON")
+
+def api_request(api_key, base_url, model, messages, max_retries=10, retry_delay=120, backoff_base=1):
+    """
+    同步发送请求，在共享的请求引擎中执行 api_request_async 并等待结果
+    :return: 合法的 JSON 字符串
+    """
+    return get_engine(api_key, base_url).run(
+        api_request_async(api_key, base_url, model, messages, max_retries, retry_delay, backoff_base)
+    )
@@ -0,0 +1,114 @@
+from base.api_engine import get_engine
+from base.api_request import api_request_async
+from base.token_budget import estimate_tokens
+from base import metrics
+import asyncio
+import logging
+
+logger = logging.getLogger("api_request")
+
+# 任务类型
+TRANSLATE = "translate"  # 单条翻译
+TRANSLATE_BATCH = "translate_batch"  # 批量翻译，包括滑动窗口模式的每一轮
+SPLIT = "split"  # 单条原文分割
+SPLIT_BATCH = "split_batch"  # 批量原文分割
+SPLIT_DUO = "split_duo"  # 把超长的片段一分为二
+
+# 进程内使用的路由，由 set_router 设置；为 None 时所有请求发往调用方给出的模型
+router = None
+
+
+class Router:
+    """
+    按任务类型和输入长度选择模型与端点，首选路由失败时依次尝试后面的路由
+    简短的请求可以发往延迟更低的模型，把大模型的速率限制留给困难的请求
+    """
+
+    def __init__(self, routes, rules, fallback_retries=2):
+        """
+        :param routes: 路由名称到 {"model", "base_url", "api_key", "max_retries"} 的词典，省略的字段使用调用方的值；
+            名称 "default" 表示调用方给出的模型和端点
+        :param rules: 规则列表，每条为 {"tasks": [任务类型], "max_tokens": 输入 token 数上限, "routes": [路由名称]}，
+            tasks 和 max_tokens 可以省略；按顺序使用第一条匹配的规则，都不匹配时使用 "default"
+        :param fallback_retries: 链中不是最后一个的路由默认的尝试次数，较小的值让失败时尽快换用后面的路由
+        """
+        for rule in rules:
+            for name in rule["routes"]:
+                if name != "default" and name not in routes:
+                    raise ValueError(f"路由规则引用了不存在的路由：{name}")
+        self.routes = routes
+        self.rules = rules
+        self.fallback_retries = fallback_retries
+
+    def match(self, task, tokens):
+        """
+        :return: 路由名称列表
+        """
+        for rule in self.rules:
+            if "tasks" in rule and task not in rule["tasks"]:
+                continue
+            if rule.get("max_tokens") is not None and tokens > rule["max_tokens"]:
+                continue
+            return rule["routes"]
+        return ["default"]
+
+    def chain(self, task, tokens, api_key, base_url, model):
+        """
+        :return: 依次尝试的路由列表，每项为 (名称, api_key, base_url, model, 尝试次数)，尝试次数为 None 时使用默认值
+        """
+        names = self.match(task, tokens)
+        result = []
+        for position, name in enumerate(names):
+            route = self.routes.get(name, {})
+            max_retries = route.get("max_retries")
+            if max_retries is None and position < len(names) - 1:
+                max_retries = self.fallback_retries
+            result.append(
+                (
+                    name,
+                    route.get("api_key", api_key),
+                    route.get("base_url", base_url),
+                    route.get("model", model),
+                    max_retries,
+                )
+            )
+        return result
+
+
+def set_router(new_router):
+    global router
+    router = new_router
+
+
+async def run_on(engine, coro):
+    """
+    在端点的请求引擎的事件循环中执行协程
+    每个端点的客户端和并发控制器只能在自己的事件循环中使用，发往其他端点的请求要转交过去
+    """
+    if asyncio.get_running_loop() is engine.loop:
+        return await coro
+    return await asyncio.wrap_future(engine.submit(coro))
+
+
+async def routed_request_async(task, text, api_key, base_url, model, messages):
+    """
+    经过路由发送请求，没有设置路由时与 api_request_async 相同
+
+    :param task: 任务类型，见本模块开头的常量
+    :param text: 需要处理的文本（不含提示词和上下文），用于估计输入长度
+    :return: 合法的 JSON 字符串
+    """
+    if router is None:
+        return await api_request_async(api_key, base_url, model, messages)
+    chain = router.chain(task, estimate_tokens(text, model), api_key, base_url, model)
+    for position, (name, route_key, route_url, route_model, max_retries) in enumerate(chain):
+        options = {} if max_retries is None else {"max_retries": max_retries}
+        # 请求失败时 api_request_async 会在消息中追加提示，每个路由使用自己的副本
+        coro = api_request_async(route_key, route_url, route_model, list(messages), **options)
+        try:
+            return await run_on(get_engine(route_key, route_url), coro)
+        except Exception as e:
+            if position == len(chain) - 1:
+                raise
+            metrics.fallbacks.inc(kind="route")
+            logger.warning(f"路由 {name}（{route_model}）请求失败，改用路由 {chain[position + 1][0]}：{e}")
@@ -0,0 +1,106 @@
+import contextvars
+import itertools
+import threading
+
+# 当前协程所属的任务，由 sub_translate、sub_segment 设置，AdaptiveLimiter 据此排队
+current_job = contextvars.ContextVar("current_job", default=None)
+
+job_counter = itertools.count()
+
+
+def usage_tokens(usage):
+    """
+    从响应的 usage 对象中取出 token 数
+    缓存命中的提示词 token 取自 prompt_cache_hit_tokens（DeepSeek）或 prompt_tokens_details.cached_tokens（OpenAI）
+    :return: (提示词, 输出, 缓存命中的提示词)
+    """
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    cached_tokens = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached_tokens is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    return prompt_tokens, completion_tokens, cached_tokens
+
+
+class TokenUsage:
+    """
+    累计 API 响应中 usage 字段的 token 用量
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.seconds = 0.0  # 成功请求的累计耗时
+        self._lock = threading.Lock()
+
+    def add(self, usage, seconds=0.0):
+        """
+        :param usage: 响应中的 usage 对象，可以为 None
+        :param seconds: 本次请求耗时
+        """
+        prompt_tokens, completion_tokens, cached_tokens = usage_tokens(usage)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.completion_tokens += completion_tokens
+            self.seconds += seconds
+
+    @property
+    def uncached_tokens(self):
+        return self.prompt_tokens - self.cached_tokens
+
+    def summary(self):
+        """
+        用量摘要，用于日志
+        """
+        hit_rate = self.cached_tokens / self.prompt_tokens * 100 if self.prompt_tokens else 0
+        return (
+            f"请求 {self.requests} 次，提示词 {self.prompt_tokens} tokens"
+            f"（缓存命中 {self.cached_tokens}，未命中 {self.uncached_tokens}，命中率 {hit_rate:.1f}%），"
+            f"输出 {self.completion_tokens} tokens，请求累计耗时 {self.seconds:.1f} 秒"
+        )
+
+
+class Job:
+    """
+    一个文件的全部 LLM 请求
+    同一端点上排队的请求按任务优先级出队：先比较 level，再比较剩余工作量，越小越先执行，
+    因此最接近完成的文件优先完成
+    """
+
+    def __init__(self, name, remaining=0, level=0):
+        """
+        :param name: 任务名称，通常为文件路径
+        :param remaining: 预计剩余的工作量（字幕条数）
+        :param level: 优先级等级，越小越优先
+        """
+        self.name = name
+        self.remaining = remaining
+        self.level = level
+        self.seq = next(job_counter)  # 优先级相同时先创建的任务优先
+        self.usage = TokenUsage()  # 该任务所有请求的 token 用量
+
+    def priority(self):
+        return (self.level, self.remaining, self.seq)
+
+    def done(self, count=1):
+        """
+        记录完成的工作量
+        """
+        self.remaining -= count
+
+    def __repr__(self):
+        return f"Job({self.name!r}, remaining={self.remaining}, level={self.level})"
+
+
+def job_priority(job):
+    """
+    任务的优先级，没有任务的请求排在同等级任务之后
+    """
+    if job is None:
+        return (0, float("inf"), float("inf"))
+    return job.priority()
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import tempfile
+
+
+def media_fingerprint(path, sample_size=1 << 20, samples=8):
+    """
+    媒体文件的快速内容指纹：文件大小加上均匀分布的若干块内容的哈希
+    不读取整个文件，数 GB 的视频也只需读取几 MB；
+    大小相同、只在未采样区域有差异的两个文件会得到相同的指纹，对重新编码或替换的媒体足够区分
+
+    :param path: 文件路径
+    :param sample_size: 每块的字节数
+    :param samples: 采样块数，包括文件开头和结尾
+    :return: 十六进制指纹
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(str(size).encode())
+    with open(path, "rb") as f:
+        if size <= sample_size * samples:
+            # 小文件直接哈希全部内容
+            for block in iter(lambda: f.read(sample_size), b""):
+                digest.update(block)
+        else:
+            for i in range(samples):
+                f.seek((size - sample_size) * i // (samples - 1))
+                digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+def asr_cache_key(fingerprint, **params):
+    """
+    由媒体指纹和影响转录结果的参数（模型、精度、语言、对齐模型等）生成缓存键
+    """
+    payload = json.dumps({"media": fingerprint, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ASRCache:
+    """
+    以内容指纹为键的转录结果缓存，文件改名或移动后仍能命中，同名文件被替换后不会误用旧结果
+    每个结果是一个 JSON 文件，写入时先写临时文件再原子替换，多个工作目录、多个进程可以共享同一个缓存目录
+    """
+
+    def __init__(self, root):
+        """
+        :param root: 缓存目录
+        """
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, key):
+        """
+        :return: (transcript, aligned)，未命中时返回 None
+        """
+        try:
+            with open(self.path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry["transcript"], entry["aligned"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, transcript, aligned):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"transcript": transcript, "aligned": aligned}, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
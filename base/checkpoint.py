@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+
+class Journal:
+    """
+    追加写入的检查点日志，每行一个 JSON 记录
+    每完成一批翻译或一条分割就写入并刷新，中断后重新运行时回放已完成的结果
+    """
+
+    def __init__(self, path, fsync_interval=1.0):
+        """
+        :param path: 日志文件路径
+        :param fsync_interval: 两次 fsync 之间的最短秒数，为 0 时每次写入都 fsync；
+            每次写入都会 flush，进程崩溃或中断不会丢失记录，fsync 用于防止断电丢失
+        """
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_fsync = 0
+
+    def record(self, stage, entries):
+        """
+        写入一组记录
+        :param stage: 阶段名称，"translate" 或 "segment"
+        :param entries: 记录列表，每条记录是包含 index、text、model（翻译时还有 dst_lang）以及该阶段结果的词典
+        """
+        if not entries:
+            return
+        lines = "".join(
+            json.dumps({"stage": stage, **entry}, ensure_ascii=False) + "\n" for entry in entries
+        )
+        with self._lock:
+            if self._file is None:
+                journal_dir = os.path.dirname(self.path)
+                if journal_dir and not os.path.exists(journal_dir):
+                    os.makedirs(journal_dir)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(lines)
+            self._file.flush()
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+
+    async def record_async(self, stage, entries):
+        """
+        在线程池中写入一组记录，写入和 fsync 不阻塞请求引擎的事件循环
+        """
+        if entries:
+            await asyncio.to_thread(self.record, stage, entries)
+
+    def replay(self, dict, model=None, fields=None):
+        """
+        将日志中的结果写回字幕词典。原文（以及分割时的译文）与当前字幕不一致的记录会被忽略，
+        因此重新转录后的旧日志不会污染结果；模型或目标语言与本次运行不同的记录同样忽略
+
+        :param dict: 包含字幕信息的词典
+        :param model: 本次运行使用的模型，为 None 时不检查
+        :param fields: 译文字段到目标语言的词典，为 None 时不检查目标语言
+        :return: 回放的记录数
+        """
+        if not os.path.exists(self.path):
+            return 0
+        segments = dict["segments"]
+        count = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 崩溃时最后一行可能只写了一半
+                    continue
+                index = entry.get("index")
+                if not isinstance(index, int) or not 0 <= index < len(segments):
+                    continue
+                segment = segments[index]
+                if segment["text"] != entry.get("text"):
+                    continue
+                if model is not None and entry.get("model") != model:
+                    continue
+                if entry["stage"] == "translate":
+                    # 翻译成多种语言时，其他语言的译文记录了写入的字段
+                    field = entry.get("field", "translation")
+                    if fields is not None and (field not in fields or entry.get("dst_lang") != fields[field]):
+                        continue
+                    segment[field] = entry["translation"]
+                    count += 1
+                elif entry["stage"] == "segment":
+                    if segment.get("translation") != entry.get("translation"):
+                        continue
+                    segment["segments"] = entry["segments"]
+                    segment["translation_segments"] = entry["translation_segments"]
+                    count += 1
+        return count
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        """
+        文件处理完成后删除日志
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,176 @@
+import sqlite3
+import threading
+import time
+import os
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """
+    持久化的文件任务队列，存储在 SQLite 中
+    同一输入文件只有一个任务；文件内容变化（大小或修改时间不同）后重新排队
+    进程中断后，未完成的任务在下次启动时重新排队
+    """
+
+    def __init__(self, path, max_attempts=3):
+        """
+        :param path: SQLite 数据库路径
+        :param max_attempts: 每个任务最多尝试的次数，失败次数达到后不再重试
+        """
+        queue_dir = os.path.dirname(path)
+        if queue_dir and not os.path.exists(queue_dir):
+            os.makedirs(queue_dir)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                input_path TEXT NOT NULL UNIQUE,
+                output_path TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def enqueue(self, input_path, output_path, signature):
+        """
+        加入任务，已有相同签名的任务时不做任何事
+        :param signature: 文件签名，变化时任务重新排队并清零尝试次数
+        :return: 是否新加入或重新排队
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT signature FROM jobs WHERE input_path = ?", (input_path,)
+            ).fetchone()
+            if row is None:
+                self._conn.execute(
+                    """
+                    INSERT INTO jobs (input_path, output_path, signature, status, created, updated)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (input_path, output_path, signature, QUEUED, now, now),
+                )
+                return True
+            if row[0] == signature:
+                return False
+            self._conn.execute(
+                """
+                UPDATE jobs SET output_path = ?, signature = ?, status = ?, stage = NULL,
+                    attempts = 0, error = NULL, updated = ?
+                WHERE input_path = ?
+                """,
+                (output_path, signature, QUEUED, now, input_path),
+            )
+            return True
+
+    def claim(self, limit):
+        """
+        取出最多 limit 个排队中的任务并标记为运行中，先加入的先取出
+        :return: (id, input_path, output_path) 列表
+        """
+        if limit <= 0:
+            return []
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, input_path, output_path FROM jobs WHERE status = ? ORDER BY id LIMIT ?",
+                    (QUEUED, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, error = NULL, updated = ? WHERE id = ?",
+                    [(RUNNING, now, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def set_stage(self, job_id, stage):
+        """
+        记录运行中任务所处的阶段
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET stage = ?, updated = ? WHERE id = ?", (stage, time.time(), job_id)
+            )
+
+    def finish(self, job_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, stage = NULL, updated = ? WHERE id = ?",
+                (DONE, time.time(), job_id),
+            )
+
+    def fail(self, job_id, error):
+        """
+        记录失败，尝试次数未达到上限时重新排队
+        """
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END,
+                    stage = NULL, error = ?, updated = ?
+                WHERE id = ?
+                """,
+                (self.max_attempts, QUEUED, FAILED, str(error), time.time(), job_id),
+            )
+
+    def requeue_running(self):
+        """
+        将上次运行中断时仍在运行的任务重新排队
+        :return: 重新排队的任务数
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, stage = NULL, updated = ? WHERE status = ?",
+                (QUEUED, time.time(), RUNNING),
+            )
+            return cursor.rowcount
+
+    def counts(self):
+        """
+        :return: 各状态的任务数
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def jobs(self, status=None, limit=100):
+        """
+        列出任务，最近更新的在前
+        :return: 词典列表
+        """
+        query = "SELECT id, input_path, output_path, status, stage, attempts, error, updated FROM jobs"
+        params = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY updated DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + (limit,)).fetchall()
+        keys = ("id", "input_path", "output_path", "status", "stage", "attempts", "error", "updated")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,4 +1,8 @@
+from base.profiling import section
+from base.transcript_store import ColumnarTranscript
 import whisperX.whisperx as wsx
+import numpy as np
+import subprocess
 
 
 def fill_missing_times(segment):
@@ -40,6 +44,72 @@ def fill_missing_times(segment):
             i += 1
 
 
+def fill_missing_times_arrays(starts, ends, bounds, segment_starts, segment_ends):
+    """
+    在整条单词时间线上填充缺失的时间，结果与逐条调用 fill_missing_times 完全相同
+    用掩码找出每条字幕内连续缺失的范围，再按范围均匀分配时间
+
+    :param starts: 所有单词的 'start'，缺失为 NaN，原地修改
+    :param ends: 所有单词的 'end'，缺失为 NaN，原地修改
+    :param bounds: 每条字幕的单词在时间线上的起止下标，长度为字幕数加一
+    :param segment_starts: 每条字幕的 'start'
+    :param segment_ends: 每条字幕的 'end'
+    """
+    missing = np.isnan(starts) | np.isnan(ends)
+    if not missing.any():
+        return
+    counts = np.diff(bounds)
+    segment_of = np.repeat(np.arange(len(counts)), counts)
+    first = np.zeros(len(missing), dtype=bool)
+    first[bounds[:-1][counts > 0]] = True
+    last = np.zeros(len(missing), dtype=bool)
+    last[bounds[1:][counts > 0] - 1] = True
+    # 连续缺失范围的起点和终点（不跨越字幕）
+    previous_missing = np.concatenate(([False], missing[:-1])) & ~first
+    next_missing = np.concatenate((missing[1:], [False])) & ~last
+    run_starts = np.flatnonzero(missing & ~previous_missing)
+    run_ends = np.flatnonzero(missing & ~next_missing) + 1
+    run_segments = segment_of[run_starts]
+    # 前一个单词的 'end'，范围从字幕开头开始时取字幕的 'start'
+    prev_end = np.where(
+        first[run_starts], segment_starts[run_segments], ends[np.maximum(run_starts - 1, 0)]
+    )
+    # 后一个单词的 'start'，范围到字幕结尾时取字幕的 'end'
+    next_start = np.where(
+        last[run_ends - 1], segment_ends[run_segments], starts[np.minimum(run_ends, len(starts) - 1)]
+    )
+    # 均匀分配时间
+    time_per_word = (next_start - prev_end) / (run_ends - run_starts + 1)
+    indices = np.flatnonzero(missing)
+    run_of = np.repeat(np.arange(len(run_starts)), run_ends - run_starts)
+    offsets = (indices - run_starts[run_of]).astype(np.float64)
+    starts[indices] = prev_end[run_of] + offsets * time_per_word[run_of]
+    ends[indices] = prev_end[run_of] + (offsets + 1) * time_per_word[run_of]
+
+
+def fill_missing_times_bulk(transcript):
+    """
+    填充整个转录结果中缺失的 'start' 和 'end'
+    列式转录（ColumnarTranscript）直接在时间列上向量化计算；词典形式的转录取出时间本身就要逐词访问，
+    逐条调用 fill_missing_times 反而更快
+
+    :param transcript: 包含 segments 的转录词典或 ColumnarTranscript
+    """
+    segments = transcript["segments"]
+    word_arrays = getattr(transcript, "word_arrays", None)
+    if word_arrays is None:
+        for segment in segments:
+            fill_missing_times(segment)
+        return
+    fill_missing_times_arrays(
+        word_arrays["start"],
+        word_arrays["end"],
+        np.asarray(transcript.word_bounds),
+        np.array([segment.get("start", np.nan) for segment in segments], dtype=np.float64),
+        np.array([segment.get("end", np.nan) for segment in segments], dtype=np.float64),
+    )
+
+
 def transcribe(
     audio_file,
     device="cuda",
@@ -67,26 +137,180 @@ def transcribe(
         device,
         return_char_alignments=False,
     )
-    for segment in aligned["segments"]:
-        fill_missing_times(segment)
+    fill_missing_times_bulk(aligned)
     aligned = {"segments": aligned["segments"]}
     return transcript, aligned
 
 
 def transcribe_batch(
-    audio_file, device, whisper_model, align_model, metadata, batch_size=16, language="en"
+    audio_file, device, whisper_model, align_model, metadata, batch_size=16, language="en", columnar=False
 ):
-    audio = wsx.load_audio(audio_file)
-    transcript = whisper_model.transcribe(audio, language=language, batch_size=batch_size)
-    aligned = wsx.align(
-        transcript["segments"],
-        align_model,
-        metadata,
-        audio,
-        device,
-        return_char_alignments=False,
-    )
-    for segment in aligned["segments"]:
-        fill_missing_times(segment)
+    """
+    一次读入整个文件转录和对齐
+
+    :param columnar: 为 True 时对齐结果转换为 ColumnarTranscript，缺失的时间在时间列上向量化填充
+    :return: (transcript, aligned)
+    """
+    with section("load_audio"):
+        audio = wsx.load_audio(audio_file)
+    with section("whisper"):
+        transcript = whisper_model.transcribe(audio, language=language, batch_size=batch_size)
+    with section("align"):
+        aligned = wsx.align(
+            transcript["segments"],
+            align_model,
+            metadata,
+            audio,
+            device,
+            return_char_alignments=False,
+        )
     aligned = {"segments": aligned["segments"]}
+    if columnar:
+        with section("to_columnar"):
+            aligned = ColumnarTranscript.from_dict(aligned)
+    with section("fill_missing_times"):
+        fill_missing_times_bulk(aligned)
+    return transcript, aligned
+
+
+def decode_windows(audio_file, window=600, overlap=30, sr=16000):
+    """
+    用 ffmpeg 流式解码音频，逐个产生相互重叠的窗口，内存中只保留当前窗口
+
+    :param audio_file: 音视频文件路径
+    :param window: 相邻窗口起点的间隔（秒）
+    :param overlap: 窗口与下一个窗口重叠的时长（秒）
+    :param sr: 采样率
+    :return: 生成器，每项为 (窗口起点秒数, float32 音频, 是否最后一个窗口)
+    """
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-threads",
+        "0",
+        "-i",
+        audio_file,
+        "-f",
+        "s16le",
+        "-ac",
+        "1",
+        "-acodec",
+        "pcm_s16le",
+        "-ar",
+        str(sr),
+        "-",
+    ]
+    step = int(window * sr)
+    keep = int(overlap * sr)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def read(count):
+        data = process.stdout.read(count * 2)
+        return np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+
+    try:
+        chunk = read(step + keep)
+        if len(chunk) == 0:
+            process.wait()
+            raise RuntimeError(f"无法解码音频：{audio_file}")
+        offset = 0.0
+        while True:
+            # 先读取下一段，才能知道当前窗口是否是最后一个
+            data = read(step)
+            yield offset, chunk, len(data) == 0
+            if len(data) == 0:
+                break
+            chunk = np.concatenate([chunk[step:], data])
+            offset += window
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def shift_times(segments, offset):
+    """
+    将窗口内的时间换算为整个文件中的时间
+    """
+    for segment in segments:
+        for key in ("start", "end"):
+            if key in segment:
+                segment[key] += offset
+        for word in segment.get("words", []):
+            for key in ("start", "end"):
+                if key in word:
+                    word[key] += offset
+    return segments
+
+
+def in_window(segment, lower, upper):
+    """
+    按中点归属拼接窗口：重叠区中同一句话在两个窗口里都会出现，中点落在哪个窗口的范围内就保留哪一份
+    """
+    middle = (segment["start"] + segment["end"]) / 2
+    return lower <= middle < upper
+
+
+def transcribe_stream(
+    audio_file,
+    device,
+    whisper_model,
+    align_model,
+    metadata,
+    batch_size=16,
+    language="en",
+    window=600,
+    overlap=30,
+    columnar=False,
+):
+    """
+    分窗口转录和对齐，峰值内存与媒体时长无关
+    每个窗口比间隔多出 overlap 秒，拼接时以重叠区的中点为界，
+    窗口边缘被截断的句子会在相邻窗口中完整出现
+
+    :param window: 相邻窗口起点的间隔（秒）
+    :param overlap: 相邻窗口重叠的时长（秒），应大于单句的最大时长
+    :param columnar: 为 True 时拼接后转换为 ColumnarTranscript，缺失的时间在所有窗口拼接后一次向量化填充
+    :return: 与 transcribe_batch 相同的 (transcript, aligned)
+    """
+    transcript_segments = []
+    aligned_segments = []
+    detected_language = language
+    lower = float("-inf")
+    for offset, audio, last in decode_windows(audio_file, window, overlap):
+        with section("whisper"):
+            transcript = whisper_model.transcribe(audio, language=language, batch_size=batch_size)
+        detected_language = transcript.get("language", detected_language)
+        with section("align"):
+            aligned = wsx.align(
+                transcript["segments"],
+                align_model,
+                metadata,
+                audio,
+                device,
+                return_char_alignments=False,
+            )
+        upper = float("inf") if last else offset + window + overlap / 2
+        transcript_segments.extend(
+            segment
+            for segment in shift_times(transcript["segments"], offset)
+            if in_window(segment, lower, upper)
+        )
+        kept = [
+            segment
+            for segment in shift_times(aligned["segments"], offset)
+            if in_window(segment, lower, upper)
+        ]
+        if not columnar:
+            with section("fill_missing_times"):
+                fill_missing_times_bulk({"segments": kept})
+        aligned_segments.extend(kept)
+        lower = upper
+    transcript = {"segments": transcript_segments, "language": detected_language}
+    aligned = {"segments": aligned_segments}
+    if columnar:
+        with section("to_columnar"):
+            aligned = ColumnarTranscript.from_dict(aligned)
+        with section("fill_missing_times"):
+            fill_missing_times_bulk(aligned)
     return transcript, aligned
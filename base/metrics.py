@@ -0,0 +1,298 @@
+import bisect
+import collections
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+# 默认的耗时分桶（秒），覆盖本地处理到长时间的 API 请求
+default_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120, 300)
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in items) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, registry=None):
+        """
+        :param name: 指标名称
+        :param help: 说明
+        :param registry: 所属的 Registry，默认为 default_registry
+        """
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry or default_registry).register(self)
+
+    def samples(self):
+        """
+        :return: (后缀, 标签键, 额外标签, 值) 列表
+        """
+        with self._lock:
+            return [("", key, (), value) for key, value in self._values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    """
+    只增不减的计数
+    """
+
+    kind = "counter"
+
+    def inc(self, value=1, **labels):
+        key = label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    """
+    可以任意设置的当前值；也可以设置取值函数，导出时再读取，例如队列长度
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, registry=None):
+        super().__init__(name, help, registry)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[label_key(labels)] = value
+
+    def set_function(self, function, **labels):
+        with self._lock:
+            self._functions[label_key(labels)] = function
+
+    def _collect(self):
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                value = function()
+            except Exception:
+                continue
+            with self._lock:
+                self._values[key] = value
+
+    def samples(self):
+        self._collect()
+        return super().samples()
+
+    def snapshot(self):
+        self._collect()
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    """
+    分桶统计的观测值，例如请求延迟
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=default_buckets, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, registry)
+
+    def observe(self, value, **labels):
+        key = label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """
+        计时上下文：with histogram.time(stage="translate"): ...
+        """
+        return Timer(self, labels)
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    result.append(("_bucket", key, (("le", format_value(bound)),), cumulative))
+                result.append(("_bucket", key, (("le", "+Inf"),), count))
+                result.append(("_sum", key, (), total))
+                result.append(("_count", key, (), count))
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {
+                    "labels": dict(key),
+                    "buckets": dict(zip((str(bound) for bound in self.buckets), counts)),
+                    "sum": total,
+                    "count": count,
+                }
+                for key, (counts, total, count) in self._values.items()
+            ]
+
+
+class Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.monotonic() - self.start
+        self.histogram.observe(self.seconds, **self.labels)
+        return False
+
+
+class Registry:
+    """
+    指标集合，导出为 Prometheus 文本格式或 JSON 快照
+    另外保存最近处理的文件的各阶段耗时，只出现在 JSON 快照中
+    """
+
+    def __init__(self, recent_files=200):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._files = collections.OrderedDict()
+        self.recent_files = recent_files
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标 {metric.name} 已存在")
+            self._metrics[metric.name] = metric
+
+    def record_file(self, name, stage, seconds):
+        """
+        记录一个文件某个阶段的耗时
+        """
+        with self._lock:
+            timings = self._files.pop(name, {})
+            timings[stage] = timings.get(stage, 0) + seconds
+            self._files[name] = timings
+            while len(self._files) > self.recent_files:
+                self._files.popitem(last=False)
+
+    def render_prometheus(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, key, extra, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{format_labels(key, extra)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            files = {name: dict(timings) for name, timings in self._files.items()}
+        return {
+            "time": time.time(),
+            "metrics": {
+                metric.name: {"type": metric.kind, "help": metric.help, "values": metric.snapshot()}
+                for metric in metrics
+            },
+            "files": files,
+        }
+
+    def write(self, path):
+        """
+        原子地写入文件：扩展名为 .json 时写 JSON 快照，否则写 Prometheus 文本格式
+        """
+        if path.endswith(".json"):
+            content = json.dumps(self.snapshot(), ensure_ascii=False, indent=1)
+        else:
+            content = self.render_prometheus()
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+
+class Exporter:
+    """
+    后台线程定期把指标写入文件，长时间运行时可以随时抓取
+    """
+
+    def __init__(self, path, interval=15, registry=None):
+        self.path = path
+        self.interval = interval
+        self.registry = registry or default_registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        try:
+            self.registry.write(self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+default_registry = Registry()
+
+# 流水线
+stage_seconds = Histogram("translateflow_stage_seconds", "流水线各阶段处理一个文件的耗时")
+stage_items = Counter("translateflow_stage_items_total", "流水线各阶段处理的文件数，按结果区分")
+queue_depth = Gauge("translateflow_stage_queue_depth", "流水线各阶段输入队列中等待的文件数")
+# API 请求
+api_seconds = Histogram("translateflow_api_request_seconds", "单次 API 请求的耗时，按模型和结果区分")
+api_retries = Counter("translateflow_api_retries_total", "API 请求重试次数，按原因区分")
+api_failures = Counter("translateflow_api_failures_total", "重试后仍然失败或不可重试的 API 请求数")
+llm_tokens = Counter("translateflow_llm_tokens_total", "API 返回的 token 用量，kind 为 prompt、completion 或 cached")
+# 降级
+fallbacks = Counter("translateflow_fallbacks_total", "降级处理次数：batch_to_mono、batch_split_to_single、duo、halving")
+local_splits = Counter("translateflow_split_local_total", "超过词数限制的字幕在本地分割或交给 API 的条数")
+coalesced = Counter("translateflow_coalesced_lines_total", "合并重复行后不再单独请求的字幕条数，kind 为 translate 或 split")
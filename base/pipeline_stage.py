@@ -0,0 +1,90 @@
+import logging
+import queue
+import threading
+
+from base import metrics
+
+logger = logging.getLogger("pipline")
+
+# 队列结束标记
+STOP = object()
+
+
+class Stage:
+    """
+    流水线的一个阶段
+    若干工作线程从有界队列中取出任务处理，返回值放入下一阶段的队列。
+    队列满时 put 会阻塞，上游因此被限速，同时在内存中的任务数不超过 队列长度 + 工作线程数
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=1, next_stage=None, on_error=None):
+        """
+        :param name: 阶段名称，用于日志和线程名
+        :param func: 处理函数，接收一个任务，返回交给下一阶段的任务，返回 None 时不再传递
+        :param workers: 工作线程数
+        :param queue_size: 输入队列长度
+        :param next_stage: 下一阶段
+        :param on_error: 处理失败时的回调 on_error(任务, 异常)
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.next_stage = next_stage
+        self.on_error = on_error
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        metrics.queue_depth.set_function(self.depth, stage=name)
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def put(self, item):
+        """
+        提交任务，队列已满时阻塞
+        """
+        self.queue.put(item)
+
+    def depth(self):
+        """
+        队列中等待处理的任务数
+        """
+        return self.queue.qsize()
+
+    def close(self):
+        """
+        等待本阶段处理完所有任务，然后关闭下一阶段
+        """
+        for _ in self._threads:
+            self.queue.put(STOP)
+        for t in self._threads:
+            t.join()
+        if self.next_stage is not None:
+            self.next_stage.close()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is STOP:
+                return
+            timer = metrics.stage_seconds.time(stage=self.name)
+            try:
+                with timer:
+                    result = self.func(item)
+            except Exception as e:
+                metrics.stage_items.inc(stage=self.name, result="error")
+                logger.exception(f"流水线阶段 {self.name} 处理失败：{e}")
+                if self.on_error is not None:
+                    try:
+                        self.on_error(item, e)
+                    except Exception:
+                        logger.exception(f"流水线阶段 {self.name} 失败回调出错")
+                continue
+            metrics.stage_items.inc(stage=self.name, result="ok")
+            if isinstance(item, dict) and "input_path" in item:
+                metrics.default_registry.record_file(item["input_path"], self.name, timer.seconds)
+            if result is not None and self.next_stage is not None:
+                self.next_stage.put(result)
@@ -0,0 +1,234 @@
+import cProfile
+import collections
+import contextlib
+import contextvars
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+logger = logging.getLogger("pipline")
+
+# 当前线程正在分析的阶段，section 通过它找到记录的位置
+current_profile = contextvars.ContextVar("current_profile", default=None)
+# 同一时间只能有一个 cProfile 在运行（Python 3.12 起 cProfile 基于全局的 sys.monitoring），
+# 其余同时运行的阶段只记录采样调用栈、耗时和内存
+cpu_profile_lock = threading.Lock()
+
+
+class Sampler:
+    """
+    后台线程定期采样所有线程的调用栈，统计为 flamegraph.pl / speedscope 可读的折叠格式
+    请求引擎的事件循环在单独的线程中运行，翻译和分割的协程（包括 align_segments）只能通过采样看到
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class StageProfile:
+    """
+    一个文件某个流水线阶段的性能分析：cProfile、调用栈采样、各小节的耗时和内存峰值
+    结果写入 directory/name.阶段.{prof,txt,folded,json}
+    """
+
+    def __init__(self, directory, name, stage, memory=True, interval=0.005, top=40):
+        """
+        :param directory: 分析结果目录
+        :param name: 文件的输出相对路径，不含扩展名
+        :param stage: 阶段名称
+        :param memory: 是否用 tracemalloc 记录内存峰值，开启后 Python 的内存分配会明显变慢
+        :param interval: 调用栈采样间隔（秒）
+        :param top: 文本报告中列出的函数数
+        """
+        self.path = os.path.join(directory, name) + "." + stage
+        self.stage = stage
+        self.memory = memory
+        self.interval = interval
+        self.top = top
+        self.sections = {}
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def fold_peak(self, peak):
+        """
+        合并 tracemalloc 的峰值；小节开始时会重置峰值，重置前先合并到阶段的峰值中
+        """
+        with self._lock:
+            self.peak = max(self.peak, peak)
+
+    def record(self, name, wall, cpu, peak):
+        with self._lock:
+            section = self.sections.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_memory": 0})
+            section["calls"] += 1
+            section["wall"] += wall
+            section["cpu"] += cpu
+            section["peak_memory"] = max(section["peak_memory"], peak)
+
+    @contextlib.contextmanager
+    def run(self):
+        """
+        分析 with 块中的代码
+        """
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            start_memory, peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        profiler = None
+        if cpu_profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        else:
+            logger.warning(f"{self.path}：另一个阶段正在运行 cProfile，本阶段只记录采样调用栈")
+        sampler = Sampler(self.interval).start()
+        token = current_profile.set(self)
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                cpu_profile_lock.release()
+            wall = time.perf_counter() - wall
+            cpu = time.thread_time() - cpu
+            current_profile.reset(token)
+            sampler.stop()
+            if self.memory:
+                _, peak = tracemalloc.get_traced_memory()
+                self.fold_peak(peak)
+                self.peak = max(self.peak - start_memory, 0)
+            try:
+                self.write(profiler, sampler, wall, cpu)
+            except OSError as e:
+                logger.error(f"写入性能分析结果失败：{self.path}：{e}")
+
+    def write(self, profiler, sampler, wall, cpu):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        report = {
+            "stage": self.stage,
+            "wall": wall,
+            "cpu": cpu,
+            "peak_memory": self.peak if self.memory else None,
+            # 进程启动以来的最大常驻内存（字节），包括 tracemalloc 看不到的原生分配
+            "max_rss": max_rss(),
+            "sections": self.sections,
+        }
+        with open(self.path + ".json", "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        with open(self.path + ".folded", "w", encoding="utf-8") as f:
+            f.write(sampler.folded())
+
+        lines = [
+            f"阶段 {self.stage}：耗时 {wall:.2f} 秒，本线程 CPU {cpu:.2f} 秒",
+        ]
+        if self.memory:
+            lines.append(f"Python 内存峰值（相对阶段开始）{format_bytes(self.peak)}")
+        if report["max_rss"] is not None:
+            lines.append(f"进程最大常驻内存 {format_bytes(report['max_rss'])}")
+        if self.sections:
+            lines.append("")
+            lines.append(f"{'小节':<20}{'次数':>6}{'耗时':>10}{'CPU':>10}{'内存峰值':>12}")
+            for name, section in self.sections.items():
+                lines.append(
+                    f"{name:<20}{section['calls']:>6}{section['wall']:>10.2f}{section['cpu']:>10.2f}"
+                    f"{format_bytes(section['peak_memory']):>12}"
+                )
+        if profiler is not None:
+            profiler.dump_stats(self.path + ".prof")
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(self.top)
+            lines.append("")
+            lines.append(stream.getvalue())
+        with open(self.path + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+@contextlib.contextmanager
+def section(name):
+    """
+    记录当前阶段中一个小节的耗时、本线程 CPU 时间和内存峰值；没有在分析时不做任何事
+    耗时远大于 CPU 时间说明在等待（API 请求、重试间隔、磁盘），反之是计算密集
+    """
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    tracing = profile.memory and tracemalloc.is_tracing()
+    if tracing:
+        start_memory, peak = tracemalloc.get_traced_memory()
+        profile.fold_peak(peak)
+        tracemalloc.reset_peak()
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall
+        cpu = time.thread_time() - cpu
+        peak = 0
+        if tracing:
+            _, peak = tracemalloc.get_traced_memory()
+            profile.fold_peak(peak)
+            peak = max(peak - start_memory, 0)
+        profile.record(name, wall, cpu, peak)
+
+
+def max_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KB，macOS 上是字节
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
@@ -1,15 +1,13 @@
 import json
 
-def generate_bilingual_srt(json_data, output_file):
+def iter_cues(json_data):
     """
-    将 JSON 数据生成双语 SRT 字幕文件
+    遍历 JSON 数据中的每个小分段，计算其时间
 
     :param json_data: 包含字幕信息的 JSON 数据
-    :param output_file: 输出的 SRT 文件路径
+    :return: 生成 (开始秒数, 结束秒数, 原文, 译文)
     """
     segments = json_data["segments"]
-    srt_content = []
-    segment_index = 1  # SRT 字幕序号从 1 开始
 
     for segment in segments:
         # 获取原文和译文的分段
@@ -40,28 +38,54 @@ def generate_bilingual_srt(json_data, output_file):
                 start_time = segment["start"]
                 end_time = segment["end"]
 
-            # 将时间格式化为 SRT 时间格式 (HH:MM:SS,ms)
-            start_time_str = format_time(start_time)
-            end_time_str = format_time(end_time)
+            yield start_time, end_time, original_text, translation_text
+
 
-            # 生成 SRT 字幕块
-            srt_block = f"{segment_index}\n{start_time_str} --> {end_time_str}\n{original_text}\n{translation_text}\n"
-            srt_content.append(srt_block)
-            segment_index += 1
+def generate_bilingual_srt(json_data, output_file):
+    """
+    将 JSON 数据生成双语 SRT 字幕文件
+
+    :param json_data: 包含字幕信息的 JSON 数据
+    :param output_file: 输出的 SRT 文件路径
+    """
+    srt_content = []
+    segment_index = 1  # SRT 字幕序号从 1 开始
+
+    for start_time, end_time, original_text, translation_text in iter_cues(json_data):
+        # 将时间格式化为 SRT 时间格式 (HH:MM:SS,ms)
+        start_time_str = format_time(start_time)
+        end_time_str = format_time(end_time)
+
+        # 生成 SRT 字幕块
+        srt_block = f"{segment_index}\n{start_time_str} --> {end_time_str}\n{original_text}\n{translation_text}\n"
+        srt_content.append(srt_block)
+        segment_index += 1
 
     # 将 SRT 内容写入文件
     with open(output_file, "w", encoding="utf-8") as f:
         f.write("\n".join(srt_content))
 
-def format_time(seconds):
+def split_time(seconds):
     """
-    将秒数格式化为 SRT 时间格式 (HH:MM:SS,ms)
+    将秒数拆分为时、分、秒、毫秒，毫秒向下取整
 
     :param seconds: 秒数
-    :return: 格式化后的时间字符串
+    :return: (时, 分, 秒, 毫秒)
     """
     hours = int(seconds // 3600)
     minutes = int((seconds % 3600) // 60)
     seconds = seconds % 60
     milliseconds = int((seconds - int(seconds)) * 1000)
-    return f"{hours:02}:{minutes:02}:{int(seconds):02},{milliseconds:03}"
\ No newline at end of file
+    return hours, minutes, int(seconds), milliseconds
+
+
+def format_time(seconds, separator=","):
+    """
+    将秒数格式化为 SRT 时间格式 (HH:MM:SS,ms)
+
+    :param seconds: 秒数
+    :param separator: 秒与毫秒之间的分隔符，WebVTT 使用 "."
+    :return: 格式化后的时间字符串
+    """
+    hours, minutes, seconds, milliseconds = split_time(seconds)
+    return f"{hours:02}:{minutes:02}:{seconds:02}{separator}{milliseconds:03}"
\ No newline at end of file
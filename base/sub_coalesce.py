@@ -0,0 +1,64 @@
+import collections
+import re
+import threading
+import unicodedata
+
+whitespace = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """
+    归一化字幕文本，用于判断两行是否相同：统一 Unicode 形式、合并空白
+    标点和大小写保留，"Right?" 与 "Right." 的译文不同，"US" 与 "us" 也不同
+    """
+    return whitespace.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class Coalescer:
+    """
+    合并重复的字幕行：同一文件和同一次运行的多个文件中相同的文本只请求一次，结果分发给每一处
+    讲座、直播的转录中 "Okay."、"Thank you." 和固定的开场白会反复出现
+
+    结果按命名空间保存（例如 模型 + 语言对，或 模型 + 词数限制），只保存在内存中，
+    超过 max_entries 时淘汰最久未使用的条目
+    """
+
+    def __init__(self, ambiguous=(), context=1, max_entries=100000):
+        """
+        :param ambiguous: 有歧义、需要结合上下文翻译的文本（按 normalize_text 比较），
+            例如 "Right."、"That's it."；这些行只与前后文也相同的行合并
+        :param context: 有歧义的行比较的前后文行数，为 0 时有歧义的行也只按文本合并
+        :param max_entries: 保存的结果数上限
+        """
+        self.ambiguous = {normalize_text(text) for text in ambiguous}
+        self.context = context
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._results = collections.OrderedDict()
+
+    def key(self, texts, index):
+        """
+        第 index 行的合并键
+        :param texts: 文件中所有行的原文
+        """
+        text = normalize_text(texts[index])
+        if self.context and text in self.ambiguous:
+            lower = max(0, index - self.context)
+            upper = min(len(texts), index + self.context + 1)
+            neighbors = [normalize_text(texts[i]) for i in range(lower, upper) if i != index]
+            return "\n".join([text, str(index - lower)] + neighbors)
+        return text
+
+    def get(self, namespace, key):
+        with self._lock:
+            value = self._results.get((namespace, key))
+            if value is not None:
+                self._results.move_to_end((namespace, key))
+            return value
+
+    def put(self, namespace, key, value):
+        with self._lock:
+            self._results[(namespace, key)] = value
+            self._results.move_to_end((namespace, key))
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
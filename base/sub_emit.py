@@ -0,0 +1,80 @@
+from base.srt_generate import iter_cues, format_time, split_time
+import pysubs2
+
+
+def to_milliseconds(seconds):
+    """
+    将秒数转换为毫秒，取整方式与 SRT 时间格式相同
+    """
+    hours, minutes, seconds, milliseconds = split_time(seconds)
+    return pysubs2.make_time(h=hours, m=minutes, s=seconds, ms=milliseconds)
+
+
+def emit_subtitles(
+    json_data,
+    srt_path=None,
+    ass_path=None,
+    vtt_path=None,
+    original_style=None,
+    translated_style=None,
+):
+    """
+    遍历一次 JSON 数据，同时生成所选格式的双语字幕文件
+    SRT 和 WebVTT 边遍历边写入，ASS 直接由字幕事件构建，不再读取 SRT 文件
+
+    :param json_data: 包含字幕信息的 JSON 数据
+    :param srt_path: 输出的 SRT 文件路径，为 None 时不生成
+    :param ass_path: 输出的 ASS 文件路径，为 None 时不生成
+    :param vtt_path: 输出的 WebVTT 文件路径，为 None 时不生成
+    :param original_style: ASS 原文样式
+    :param translated_style: ASS 译文样式
+    """
+    srt_file = open(srt_path, "w", encoding="utf-8") if srt_path else None
+    vtt_file = open(vtt_path, "w", encoding="utf-8") if vtt_path else None
+    ass_subs = None
+    if ass_path:
+        # 创建ASS文件对象，添加样式
+        ass_subs = pysubs2.SSAFile()
+        ass_subs.styles["Original"] = original_style
+        ass_subs.styles["Translated"] = translated_style
+
+    try:
+        if vtt_file is not None:
+            vtt_file.write("WEBVTT\n\n")
+        segment_index = 1  # SRT 字幕序号从 1 开始
+        for start_time, end_time, original_text, translation_text in iter_cues(json_data):
+            if srt_file is not None:
+                # 字幕块之间空一行，与 generate_bilingual_srt 的输出相同
+                if segment_index > 1:
+                    srt_file.write("\n")
+                srt_file.write(
+                    f"{segment_index}\n{format_time(start_time)} --> {format_time(end_time)}\n{original_text}\n{translation_text}\n"
+                )
+            if vtt_file is not None:
+                # WebVTT 中空行表示字幕块结束，只写入非空的行
+                lines = "\n".join(text for text in (original_text, translation_text) if text)
+                vtt_file.write(
+                    f"{format_time(start_time, '.')} --> {format_time(end_time, '.')}\n{lines}\n\n"
+                )
+            if ass_subs is not None:
+                start = to_milliseconds(start_time)
+                end = to_milliseconds(end_time)
+                if original_text:
+                    ass_subs.events.append(
+                        pysubs2.SSAEvent(start=start, end=end, text=original_text, style="Original")
+                    )
+                # 添加译文
+                if translation_text:
+                    ass_subs.events.append(
+                        pysubs2.SSAEvent(start=start, end=end, text=translation_text, style="Translated")
+                    )
+            segment_index += 1
+    finally:
+        if srt_file is not None:
+            srt_file.close()
+        if vtt_file is not None:
+            vtt_file.close()
+
+    # 保存ASS文件
+    if ass_subs is not None:
+        ass_subs.save(ass_path)
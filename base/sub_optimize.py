@@ -1,31 +1,92 @@
 import re
 
 
+class RulePack:
+    """
+    一组按顺序执行的字幕规范化规则
+    每条规则是一个接收字符串、返回字符串的函数
+    """
+
+    def __init__(self, name, rules):
+        """
+        :param name: 规则包名称
+        :param rules: 规则函数列表
+        """
+        self.name = name
+        self.rules = list(rules)
+
+    def __call__(self, sentence):
+        for rule in self.rules:
+            sentence = rule(sentence)
+        return sentence
+
+
+# 单语言规则包：语言 -> RulePack
+rule_packs = {}
+# 语言对规则包：(源语言, 目标语言) -> RulePack，作用于译文
+pair_rule_packs = {}
+
+
+def register_rules(lang, pack):
+    """
+    注册单语言规则包，作用于该语言的原文或译文
+    """
+    rule_packs[lang] = pack
+
+
+def register_pair_rules(src_lang, dst_lang, pack):
+    """
+    注册语言对规则包，在目标语言规则之后作用于译文
+    """
+    pair_rule_packs[(src_lang, dst_lang)] = pack
+
+
+def compile_rules(*packs):
+    """
+    将多个规则包合成为一个函数，忽略为 None 的规则包
+    :return: 接收字符串、返回字符串的函数；没有规则时返回 None
+    """
+    packs = [pack for pack in packs if pack is not None]
+    if not packs:
+        return None
+    if len(packs) == 1:
+        return packs[0]
+
+    def apply(sentence):
+        for pack in packs:
+            sentence = pack(sentence)
+        return sentence
+
+    return apply
+
+
 def sub_optimize(dict, src_lang, dst_lang):
     """
     优化字幕到符合规范
 
     :param dict: 包含字幕信息的词典
     """
-    segments = dict["segments"]
-    match src_lang:
-        case "en-US":
-            for segment in segments:
-                segment["segments"] = [en_US(seg) for seg in segment["segments"]]
-        case "zh-CN":
-            for segment in segments:
-                segment["segments"] = [zh_CN(seg) for seg in segment["segments"]]
-    match dst_lang:
-        case "en-US":
-            for segment in segments:
-                segment["translation_segments"] = [en_US(seg) for seg in segment["translation_segments"]]
-        case "zh-CN":
-            for segment in segments:
-                segment["translation_segments"] = [zh_CN(seg) for seg in segment["translation_segments"]]
-    if src_lang == "en-US" and dst_lang == "zh-CN":
-        for segment in segments:
-            for segment in segments:
-                segment["translation_segments"] = [en_US2zh_CN(seg) for seg in segment["translation_segments"]]
+    sub_optimize_bulk([dict], src_lang, dst_lang)
+
+
+def sub_optimize_bulk(dicts, src_lang, dst_lang):
+    """
+    批量优化多个字幕词典，规则只编译一次，每条字幕只处理一遍
+
+    :param dicts: 包含字幕信息的词典列表
+    """
+    original_rules = compile_rules(rule_packs.get(src_lang))
+    translation_rules = compile_rules(
+        rule_packs.get(dst_lang), pair_rule_packs.get((src_lang, dst_lang))
+    )
+    for dict in dicts:
+        for segment in dict["segments"]:
+            if original_rules is not None:
+                segment["segments"] = [original_rules(seg) for seg in segment["segments"]]
+            if translation_rules is not None:
+                segment["translation_segments"] = [
+                    translation_rules(seg) for seg in segment["translation_segments"]
+                ]
 
 
 def en_US(sentence):
@@ -42,33 +103,49 @@ def en_US(sentence):
         return sentence
 
 
+# 中文句中的逗号、顿号、分号、句号替换为空格
+zh_CN_table = str.maketrans({"，": " ", "、": " ", "；": " ", "。": " "})
+
+
 def zh_CN(sentence):
     """
     替换中文句子句中的逗号、顿号、分号、句号为空格，去除句末的句号
     :param sentence: 中文句子
     :return: 替换并去除句末句号后的中文句子
     """
-    punctuation_list = ["，", "、", "；", "。"]
-    for punctuation in punctuation_list:
-        sentence = sentence.replace(punctuation, " ")
+    sentence = sentence.translate(zh_CN_table)
     if sentence.endswith(" "):
         return sentence.rstrip()
     else:
         return sentence
 
-def en_US2zh_CN(sentence):
-    # 英文单词与中文间前后均空格
-    sentence = re.sub(r"([a-zA-Z]+)([\u4e00-\u9fa5])", r"\1 \2", sentence)
-    sentence = re.sub(r"([\u4e00-\u9fa5])([a-zA-Z]+)", r"\1 \2", sentence)
-
-    # 数字与中文或英文前后均空格
-    sentence = re.sub(r"(\d+)([a-zA-Z\u4e00-\u9fa5])", r"\1 \2", sentence)
-    sentence = re.sub(r"([a-zA-Z\u4e00-\u9fa5])(\d+)", r"\1 \2", sentence)
 
-    # 数字与英文单位（1~2 个字母）间不空格
-    sentence = re.sub(r"(\d+) ([a-zA-Z]{1,2}[^a-zA-Z])", r"\1\2", sentence)
+# 英文单词与中文间前后均空格
+en_zh_pattern = re.compile(r"([a-zA-Z]+)([\u4e00-\u9fa5])")
+zh_en_pattern = re.compile(r"([\u4e00-\u9fa5])([a-zA-Z]+)")
+# 数字与中文或英文前后均空格
+digit_word_pattern = re.compile(r"(\d+)([a-zA-Z\u4e00-\u9fa5])")
+word_digit_pattern = re.compile(r"([a-zA-Z\u4e00-\u9fa5])(\d+)")
+# 数字与英文单位（1~2 个字母）间不空格
+digit_unit_pattern = re.compile(r"(\d+) ([a-zA-Z]{1,2}[^a-zA-Z])")
+# 1~2 个英文字母后接数字不空格
+unit_digit_pattern = re.compile(r"([^a-zA-Z][a-zA-Z]{1,2}) (\d+)")
+# 以上规则都需要英文字母或数字，没有时可以跳过
+en_US2zh_CN_guard = re.compile(r"[a-zA-Z]|\d")
 
-    # 1~2 个英文字母后接数字不空格
-    sentence = re.sub(r"([^a-zA-Z][a-zA-Z]{1,2}) (\d+)", r"\1\2", sentence)
 
+def en_US2zh_CN(sentence):
+    if not en_US2zh_CN_guard.search(sentence):
+        return sentence
+    sentence = en_zh_pattern.sub(r"\1 \2", sentence)
+    sentence = zh_en_pattern.sub(r"\1 \2", sentence)
+    sentence = digit_word_pattern.sub(r"\1 \2", sentence)
+    sentence = word_digit_pattern.sub(r"\1 \2", sentence)
+    sentence = digit_unit_pattern.sub(r"\1\2", sentence)
+    sentence = unit_digit_pattern.sub(r"\1\2", sentence)
     return sentence
+
+
+register_rules("en-US", RulePack("en-US", [en_US]))
+register_rules("zh-CN", RulePack("zh-CN", [zh_CN]))
+register_pair_rules("en-US", "zh-CN", RulePack("en-US->zh-CN", [en_US2zh_CN]))
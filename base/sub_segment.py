@@ -1,11 +1,15 @@
-from base.api_request import api_request
-import threading
+from base.api_router import routed_request_async, SPLIT, SPLIT_BATCH, SPLIT_DUO
+from base.api_engine import get_engine
+from base.api_scheduler import current_job
+from base import metrics
+from base.sub_split import split_local
+import asyncio
 import json
-import time
 import logging
 import colorlog
 import os
 import jieba
+import numpy as np
 
 split_char = " ,.;:!，。？：；！"
 
@@ -69,6 +73,36 @@ EXAMPLE JSON OUTPUT:
 }
 """
 
+prompt_batch = """
+The user will ask you to segment several subtitles into smaller parts in a way that is suitable for pauses and does not split individual grammatical structures. Each segmented part should not exceed the specified number of words. You must not add, delete, or modify any character. Any segment must not be empty or all spaces. Output in JSON format.
+
+EXAMPLE JSON INPUT:
+{
+    "word_limit": 9,
+    "inputs": {
+        "0": "This is a sample sentence. You should process this sentence according to my instructions.",
+        "1": "Segment every input separately and keep the same key for its output."
+    }
+}
+
+EXAMPLE JSON OUTPUT:
+{
+    "outputs": {
+        "0": [
+            "This is a sample sentence. ",
+            "You should process this sentence ",
+            "according to my instructions."
+        ],
+        "1": [
+            "Segment every input separately ",
+            "and keep the same key for its output."
+        ]
+    }
+}
+
+"outputs" must contain every key of "inputs".
+"""
+
 prompt_spec = """
 The user will ask you to convert a long sentence into a specified number of short sentences. The original meaning should not be altered. Do not use sentences with semantic repetition. Any short sentence must not be empty or all spaces. Output in JSON format.
 
@@ -110,6 +144,136 @@ EXAMPLE JSON OUTPUT:
 
 def align_segments(source_text, segments):
     """
+    对齐分割后的小段与原字符串，确保每个小段与原字符串的重合字符最多。
+    处理重叠时，将重叠部分留给邻近较短的片段，并去除较长片段的重合部分。
+    修正小段中与原字符串不一致的字符。
+    用 NumPy 滑动窗口一次算出所有起始位置的重合字符数，用区间索引查找字符所属的片段，
+    结果与 align_segments_reference 完全相同。
+
+    :param original_text: 原始字符串
+    :param segments: 分割后的小段列表
+    :return: 对齐后的小段列表
+    """
+    original_length = len(source_text)
+    source = np.frombuffer(source_text.encode("utf-32-le"), dtype=np.uint32)
+    segment_positions = []  # 记录每个小段的起始和结束位置
+
+    # 找到每个小段在原字符串中的最佳匹配位置
+    expected_start = 0  # 预期起始位置（之前片段的长度之和）
+    for segment in segments:
+        segment_length = len(segment)
+        start_count = original_length - segment_length + 1
+        if start_count <= 0:
+            # 片段比原字符串长，没有可选位置（与参考实现相同）
+            raise IndexError("list index out of range")
+
+        # 每个起始位置的重合字符数
+        if segment_length == 0:
+            overlaps = np.zeros(start_count, dtype=np.int64)
+        else:
+            pattern = np.frombuffer(segment.encode("utf-32-le"), dtype=np.uint32)
+            windows = np.lib.stride_tricks.sliding_window_view(source, segment_length)
+            overlaps = np.count_nonzero(windows == pattern, axis=1)
+
+        # 有多个最大重合位置时，选择与预期起始位置最接近的一个（距离相同取靠前的）
+        best_positions = np.flatnonzero(overlaps == overlaps.max())
+        best_start = int(best_positions[np.argmin(np.abs(best_positions - expected_start))])
+
+        segment_positions.append((best_start, best_start + segment_length))
+        expected_start += segment_length
+
+    # 处理小段之间的重叠
+    segment_positions.sort()  # 按起始位置排序
+    for i in range(len(segment_positions) - 1):
+        current_start, current_end = segment_positions[i]
+        next_start, next_end = segment_positions[i + 1]
+
+        if current_end > next_start:
+            # 比较当前片段和下一个片段的长度
+            current_length = current_end - current_start
+            next_length = next_end - next_start
+
+            if current_length > next_length:
+                # 当前片段较长，去除重叠部分
+                segment_positions[i] = (current_start, next_start)
+            else:
+                # 下一个片段较长，去除重叠部分
+                segment_positions[i + 1] = (current_end, next_end)
+
+    # 根据调整后的位置生成对齐后的小段，直接使用原字符串的对应部分
+    aligned_segments = [source_text[start:end] for start, end in segment_positions]
+
+    # 区间索引：每个字符所属的片段编号，多个片段覆盖时取编号最小的，未覆盖为 -1
+    owner = np.full(original_length, -1, dtype=np.int64)
+    for idx in range(len(segment_positions) - 1, -1, -1):
+        start, end = segment_positions[idx]
+        owner[start:end] = idx
+    covered = owner >= 0
+    uncovered = np.flatnonzero(~covered)
+    if len(uncovered) == 0:
+        return aligned_segments
+
+    # 每个位置左侧（不含）和右侧（不含）最近的已覆盖字符
+    indices = np.arange(original_length)
+    covered_left = np.maximum.accumulate(np.where(covered, indices, -1))
+    prev_covered = np.concatenate(([-1], covered_left[:-1]))
+    covered_right = np.minimum.accumulate(
+        np.where(covered, indices, original_length)[::-1]
+    )[::-1]
+    next_covered = np.concatenate((covered_right[1:], [original_length]))
+    owner = owner.tolist()
+    lengths = [end - start for start, end in segment_positions]
+
+    def owner_length(index):
+        # 找到字符所属片段的长度，没有找到时设为无穷大
+        return float("inf") if index is None else lengths[index]
+
+    # 找到未分配的字符，并分配给邻近的最短小段
+    # 处理过程中新分配的字符也算作已覆盖，但不属于任何片段（与参考实现相同）
+    last_assigned = -1
+    for i in uncovered.tolist():
+        left = max(int(prev_covered[i]), last_assigned)
+        right = int(next_covered[i])
+        left_segment_index = owner[left] if left >= 0 and owner[left] >= 0 else None
+        right_segment_index = (
+            owner[right] if right < original_length and owner[right] >= 0 else None
+        )
+
+        if left >= 0 and right < original_length:
+            # 如果左右都有片段，选择较短的片段
+            if owner_length(left_segment_index) <= owner_length(right_segment_index):
+                # 分配给左边的小段
+                aligned_segments[left_segment_index] += source_text[i]
+            else:
+                # 分配给右边的小段
+                aligned_segments[right_segment_index] = (
+                    source_text[i] + aligned_segments[right_segment_index]
+                )
+            last_assigned = i
+        elif left >= 0:
+            # 只有左边有片段，分配给左边
+            if left_segment_index is not None:
+                aligned_segments[left_segment_index] += source_text[i]
+                last_assigned = i
+        elif right < original_length:
+            # 只有右边有片段，分配给右边
+            if right_segment_index is not None:
+                aligned_segments[right_segment_index] = (
+                    source_text[i] + aligned_segments[right_segment_index]
+                )
+                last_assigned = i
+        else:
+            # 如果没有左右片段（理论上不会发生），直接分配给第一个片段
+            aligned_segments[0] += source_text[i]
+            last_assigned = i
+
+    return aligned_segments
+
+
+def align_segments_reference(source_text, segments):
+    """
+    align_segments 的逐字符参考实现，结果与 align_segments 完全相同，用于回归比对和基准测试。
+
     对齐分割后的小段与原字符串，确保每个小段与原字符串的重合字符最多。
     处理重叠时，将重叠部分留给邻近较短的片段，并去除较长片段的重合部分。
     修正小段中与原字符串不一致的字符。
@@ -286,7 +450,71 @@ def align_segments(source_text, segments):
     return aligned_segments
 
 
-def split_original(text, api_key, base_url, model, word_limit):
+async def split_long_pieces(text, segments, api_key, base_url, model, word_limit):
+    """
+    将仍超过最大词数的分段再一分为二，直到所有分段都不超过限制
+    :param text: 原文字幕，用于日志
+    :param segments: 初次分割的结果，原地修改
+    :return: 分割后的原文字幕列表
+    """
+    i = 0
+    while i < len(segments):
+        if len(segments[i].split()) > word_limit:
+            logger.warning(
+                f"""
+                原文分割：分段 {i} 超过最大长度
+                发生在：{text}
+                初次分割：{segments}
+                """
+            )
+            metrics.fallbacks.inc(kind="duo")
+            messages_duo = [
+                {"role": "system", "content": prompt_duo},
+                {"role": "user", "content": json.dumps({"input": segments[i]})},
+            ]
+            try:
+                response_duo = json.loads(
+                    await routed_request_async(SPLIT_DUO, segments[i], api_key, base_url, model, messages_duo)
+                )
+                if "output" in response_duo:
+                    response_duo["output"] = [
+                        str
+                        for str in response_duo["output"]
+                        if str.strip(split_char)
+                    ]
+                    if len(response_duo["output"]) > 1:
+                        segments[i : i + 1] = response_duo["output"]
+                    else:
+                        raise Exception(
+                            f"""
+                            原文分割：api 返回结果无效
+                            响应：{response_duo}
+                            """
+                        )
+                else:
+                    raise Exception(
+                        f"""
+                        原文分割：api 返回的 JSON 无效
+                        响应：{response_duo}
+                        """
+                    )
+            except Exception as e:
+                logger.error(
+                    f"""
+                    原文分割：分割最大片段失败：{e}
+                    发生在：{text}
+                    按照长度分割
+                    """
+                )
+                metrics.fallbacks.inc(kind="halving")
+                mid = len(segments[i]) // 2
+                segments[i : i + 1] = [segments[i][:mid], segments[i][mid:]]
+        else:
+            i += 1
+    return segments
+
+
+async def split_original_async(text, api_key, base_url, model, word_limit):
     """
     分割原文字幕
     :param text: 原文字幕
@@ -311,62 +539,11 @@ def split_original(text, api_key, base_url, model, word_limit):
     ]
 
     try:
-        response_prim = json.loads(api_request(api_key, base_url, model, messages_prim))
+        response_prim = json.loads(await routed_request_async(SPLIT, text, api_key, base_url, model, messages_prim))
         segments = [seg for seg in response_prim["output"] if seg.strip(split_char)]
 
         # 检测是否有分段超过最大长度
-        i = 0
-        while i < len(segments):
-            if len(segments[i].split()) > word_limit:
-                logger.warning(
-                    f"""
-                    原文分割：分段 {i} 超过最大长度
-                    发生在：{text}
-                    初次响应：{response_prim}
-                    """
-                )
-                messages_duo = [
-                    {"role": "system", "content": prompt_duo},
-                    {"role": "user", "content": json.dumps({"input": segments[i]})},
-                ]
-                try:
-                    response_duo = json.loads(
-                        api_request(api_key, base_url, model, messages_duo)
-                    )
-                    if "output" in response_duo:
-                        response_duo["output"] = [
-                            str
-                            for str in response_duo["output"]
-                            if str.strip(split_char)
-                        ]
-                        if len(response_duo["output"]) > 1:
-                            segments[i : i + 1] = response_duo["output"]
-                        else:
-                            raise Exception(
-                                f"""
-                                原文分割：api 返回结果无效
-                                响应：{response_duo}
-                                """
-                            )
-                    else:
-                        raise Exception(
-                            f"""
-                            原文分割：api 返回的 JSON 无效
-                            响应：{response_duo}
-                            """
-                        )
-                except Exception as e:
-                    logger.error(
-                        f"""
-                        原文分割：分割最大片段失败：{e}
-                        发生在：{text}
-                        按照长度分割
-                        """
-                    )
-                    mid = len(segments[i]) // 2
-                    segments[i : i + 1] = [segments[i][:mid], segments[i][mid:]]
-            else:
-                i += 1
+        segments = await split_long_pieces(text, segments, api_key, base_url, model, word_limit)
     except Exception as e:
         logger.error(
             f"""
@@ -377,11 +554,71 @@ def split_original(text, api_key, base_url, model, word_limit):
         segments = [text]
 
     # 调用 align_segments 函数，确保原文分割结果与原字符串对齐
-    aligned_segments = align_segments(text, segments)
+    # 对齐是纯计算，放到线程池中执行，不阻塞所有文件共享的请求引擎事件循环
+    aligned_segments = await asyncio.to_thread(align_segments, text, segments)
 
     return aligned_segments
 
 
+async def split_original_batch_async(texts, api_key, base_url, model, word_limit):
+    """
+    在一次请求中分割多条原文字幕，输入输出都以下标为键
+    请求失败或某条结果无效时，对应的字幕单独调用 split_original_async 重试
+
+    :param texts: 原文字幕列表
+    :return: 与 texts 一一对应的分割结果列表
+    """
+    if len(texts) == 1:
+        return [await split_original_async(texts[0], api_key, base_url, model, word_limit)]
+
+    messages_batch = [
+        {"role": "system", "content": prompt_batch},
+        {
+            "role": "user",
+            "content": json.dumps(
+                {"word_limit": word_limit, "inputs": {str(i): text for i, text in enumerate(texts)}}
+            ),
+        },
+    ]
+    try:
+        outputs = json.loads(
+            await routed_request_async(SPLIT_BATCH, "\n".join(texts), api_key, base_url, model, messages_batch)
+        )["outputs"]
+        if not isinstance(outputs, dict):
+            raise Exception(f"outputs 不是对象：{outputs}")
+    except Exception as e:
+        logger.error(f"批量原文分割失败，逐条重试：{e}")
+        outputs = {}
+
+    async def finish(i, text):
+        try:
+            return await finish_one(i, text)
+        except Exception as e:
+            # 单条字幕出错不影响同批次的其他字幕，这一条不分割
+            logger.error(f"原文分割失败：{e}\n发生在：{text}")
+            return [text]
+
+    async def finish_one(i, text):
+        output = outputs.get(str(i))
+        if not isinstance(output, list) or not all(isinstance(seg, str) for seg in output):
+            metrics.fallbacks.inc(kind="batch_split_to_single")
+            return await split_original_async(text, api_key, base_url, model, word_limit)
+        segments = [seg for seg in output if seg.strip(split_char)]
+        if not segments:
+            metrics.fallbacks.inc(kind="batch_split_to_single")
+            return await split_original_async(text, api_key, base_url, model, word_limit)
+        segments = await split_long_pieces(text, segments, api_key, base_url, model, word_limit)
+        return await asyncio.to_thread(align_segments, text, segments)
+
+    return list(await asyncio.gather(*(finish(i, text) for i, text in enumerate(texts))))
+
+
+def split_original(text, api_key, base_url, model, word_limit):
+    return get_engine(api_key, base_url).run(
+        split_original_async(text, api_key, base_url, model, word_limit)
+    )
+
+
 def merge_punctuation(words):
     """
     将标点符号与前一个词合并
@@ -504,19 +741,25 @@ def split_translated(text, count):
     return segments_final
 
 
-def split_segment(segment_text, translation_text, api_key, base_url, model, word_limit):
+async def split_segment_async(segment_text, translation_text, api_key, base_url, model, word_limit):
     # 分割原文字幕
-    aligned_segments = split_original(
+    aligned_segments = await split_original_async(
         segment_text, api_key, base_url, model, word_limit
     )
 
     # 分割译文字幕
     segment_count = len(aligned_segments)
-    translation_segments = split_translated(translation_text, segment_count)
+    translation_segments = await asyncio.to_thread(split_translated, translation_text, segment_count)
 
     return aligned_segments, translation_segments
 
 
+def split_segment(segment_text, translation_text, api_key, base_url, model, word_limit):
+    return get_engine(api_key, base_url).run(
+        split_segment_async(segment_text, translation_text, api_key, base_url, model, word_limit)
+    )
+
+
 def sub_segment(
     dict,
     api_key,
@@ -524,53 +767,169 @@ def sub_segment(
     model,
     word_limit=12,
     thread_count=20,
+    job=None,
+    journal=None,
+    batch_size=10,
+    local_threshold=0.8,
+    coalescer=None,
 ):
     """
     将字幕分割成不超过特定词数的小段
     把翻译分割成相同段数
 
+    不超过词数限制的字幕在本地直接处理；超过的字幕先按停顿和标点在本地分割，
+    没有把握的才每 batch_size 条合并为一次请求
+
     :param dict: 包含字幕信息的词典
     :param api_key: OpenAI API密钥
     :param base_url: API基础URL
     :param model: API模型
     :param word_limit: 分割后词数限制
-    :param thread_count: 并发线程数量
+    :param thread_count: 并发请求数量，所有请求在共享请求引擎的事件循环中执行
+    :param job: 所属任务 Job，决定请求在端点上的排队优先级，完成的字幕条数会计入其中
+    :param journal: 检查点日志 Journal，每完成一条字幕的分割就写入结果
+    :param batch_size: 每次请求分割的字幕条数，为 1 时逐条请求
+    :param local_threshold: 本地分割断点得分的最低要求，为 None 时不在本地分割
+    :param coalescer: 重复行合并 Coalescer，原文完全相同的行只请求分割一次
     """
     segments = dict["segments"]
-    threads = []  # 初始化线程列表
 
-    def worker(index):
-        segment = segments[index]
+    def journal_entries(indices):
+        return [
+            {
+                "index": index,
+                "text": segments[index]["text"],
+                "translation": segments[index]["translation"],
+                "segments": segments[index]["segments"],
+                "translation_segments": segments[index]["translation_segments"],
+                "model": model,
+            }
+            for index in indices
+        ]
+
+    def record(indices):
+        if journal is not None:
+            journal.record("segment", journal_entries(indices))
+
+    # 在本地分类：已有合法分割的跳过，不超过词数限制或本地分割有把握的直接处理，其余交给 API
+    pending = []
+    local = []
+    skipped = 0
+    for index, segment in enumerate(segments):
         # 检查是否已经有合法的分割
         if "segments" in segment and "translation_segments" in segment:
             if all(seg.strip() for seg in segment["segments"]) and all(
                 seg.strip() for seg in segment["translation_segments"]
             ):
-                logger.info(f"字幕 {index} 已有合法分割，跳过处理")
-                return
-
-        # 获取当前字幕
-        segment_text = segment["text"]
-        translation_text = segment["translation"]
-
-        # 调用分割函数
-        segments[index]["segments"], segments[index]["translation_segments"] = (
-            split_segment(
-                segment_text, translation_text, api_key, base_url, model, word_limit
-            )
+                skipped += 1
+                continue
+        if len(segment["text"].split()) <= word_limit:
+            aligned_segments = [segment["text"]]
+        elif local_threshold is not None:
+            aligned_segments = split_local(segment["text"], segment.get("words"), word_limit, local_threshold)
+            metrics.local_splits.inc(result="llm" if aligned_segments is None else "local")
+        else:
+            aligned_segments = None
+            metrics.local_splits.inc(result="llm")
+        if aligned_segments is None:
+            pending.append(index)
+            continue
+        segment["segments"] = aligned_segments
+        segment["translation_segments"] = split_translated(segment["translation"], len(aligned_segments))
+        local.append(index)
+    if skipped:
+        logger.info(f"{skipped} 条字幕已有合法分割，跳过处理")
+
+    # 原文完全相同的行只请求一次：本次运行中已经分割过的直接使用，其余的只保留第一处
+    # 分割结果必须能拼接回原文，所以按原文本身而不是归一化的文本合并
+    representatives = {}
+    followers = []
+    if coalescer is not None:
+        namespace = f"split:{model}:{word_limit}"
+        requested = []
+        for index in pending:
+            text = segments[index]["text"]
+            aligned_segments = coalescer.get(namespace, text)
+            if aligned_segments is not None:
+                segments[index]["segments"] = list(aligned_segments)
+                segments[index]["translation_segments"] = split_translated(
+                    segments[index]["translation"], len(aligned_segments)
+                )
+                local.append(index)
+            elif text in representatives:
+                followers.append(index)
+            else:
+                representatives[text] = index
+                requested.append(index)
+        if len(requested) < len(pending):
+            logger.info(f"重复行合并：{len(pending) - len(requested)} 条字幕使用相同原文的分割结果")
+            metrics.coalesced.inc(len(pending) - len(requested), kind="split")
+        pending = requested
+
+    record(local)
+    if job is not None:
+        job.done(skipped + len(local))
+
+    async def worker(indices):
+        texts = [segments[index]["text"] for index in indices]
+        results = await split_original_batch_async(texts, api_key, base_url, model, word_limit)
+        # 分割译文字幕，纯计算，放到线程池中执行
+        translation_segments = await asyncio.to_thread(
+            lambda: [
+                split_translated(segments[index]["translation"], len(aligned_segments))
+                for index, aligned_segments in zip(indices, results)
+            ]
         )
-
-    for i in range(len(segments)):
-        # 如果当前线程数达到上限，等待至少一个线程完成
-        while len(threads) >= thread_count:
-            for t in threads:
-                if not t.is_alive():  # 检查线程是否完成
-                    threads.remove(t)  # 从线程列表中移除
-            time.sleep(0.1)  # 避免忙等待
-        t = threading.Thread(target=worker, args=[i])
-        threads.append(t)
-        t.start()
-
-    # 等待剩余线程完成
-    for t in threads:
-        t.join()
+        for index, aligned_segments, translated in zip(indices, results, translation_segments):
+            segments[index]["segments"] = aligned_segments
+            segments[index]["translation_segments"] = translated
+        if journal is not None:
+            # 在线程池中写入，不阻塞请求引擎的事件循环
+            await journal.record_async("segment", journal_entries(indices))
+
+    async def run_all():
+        if job is not None:
+            current_job.set(job)
+        # 用信号量限制同时进行的请求数量
+        semaphore = asyncio.Semaphore(thread_count)
+
+        async def bounded_worker(indices):
+            try:
+                async with semaphore:
+                    await worker(indices)
+            except Exception as e:
+                # 一个批次出错不影响其他批次；这些字幕保持不分割，不写入检查点，下次运行时重新分割
+                logger.error(f"字幕分割失败，{len(indices)} 条字幕保持不分割：{e}")
+                for index in indices:
+                    if "segments" not in segments[index] or "translation_segments" not in segments[index]:
+                        segments[index]["segments"] = [segments[index]["text"]]
+                        segments[index]["translation_segments"] = [segments[index]["translation"]]
+            if job is not None:
+                job.done(len(indices))
+
+        step = max(1, batch_size)
+        results = await asyncio.gather(
+            *(bounded_worker(pending[i : i + step]) for i in range(0, len(pending), step)),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"字幕分割失败：{result}")
+
+    if pending:
+        get_engine(api_key, base_url).run(run_all())
+
+    if coalescer is not None:
+        for text, index in representatives.items():
+            # 需要请求的行都超过词数限制，只有一段说明分割失败（保留了原文），不留给之后的文件，让它们重新请求
+            if len(segments[index]["segments"]) > 1:
+                coalescer.put(namespace, text, list(segments[index]["segments"]))
+        for index in followers:
+            aligned_segments = segments[representatives[segments[index]["text"]]]["segments"]
+            segments[index]["segments"] = list(aligned_segments)
+            segments[index]["translation_segments"] = split_translated(
+                segments[index]["translation"], len(aligned_segments)
+            )
+        record(followers)
+        if job is not None:
+            job.done(len(followers))
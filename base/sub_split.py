@@ -0,0 +1,105 @@
+import re
+
+# 句末和分句标点后的断点得分
+strong_punctuation = ".?!;:。？！；："
+weak_punctuation = ",，、"
+token_pattern = re.compile(r"\S+")
+
+
+def word_gaps(tokens, words):
+    """
+    计算相邻两词之间的停顿时长
+    对齐结果中的单词与原文按空格分出的词一一对应时才使用时间戳，否则所有停顿为 0
+
+    :param tokens: 原文按空格分出的词
+    :param words: 对齐结果中的单词列表，每项包含 word、start、end
+    :return: 长度为 len(tokens) - 1 的停顿时长列表（秒）
+    """
+    gaps = [0.0] * (len(tokens) - 1)
+    if not words or len(words) != len(tokens):
+        return gaps
+    for i in range(len(tokens) - 1):
+        current = words[i]
+        following = words[i + 1]
+        if current.get("word", "").strip() != tokens[i]:
+            return [0.0] * (len(tokens) - 1)
+        if "end" in current and "start" in following:
+            gaps[i] = max(0.0, following["start"] - current["end"])
+    return gaps
+
+
+def break_scores(tokens, gaps, full_gap=0.5):
+    """
+    每个候选断点（第 i 个词之后）的得分，范围 0 到 1
+    停顿达到 full_gap 秒或句末标点得满分，逗号得 0.7，两者按概率叠加
+    """
+    scores = []
+    for token, gap in zip(tokens, gaps):
+        if token[-1] in strong_punctuation:
+            punctuation = 1.0
+        elif token[-1] in weak_punctuation:
+            punctuation = 0.7
+        else:
+            punctuation = 0.0
+        pause = min(gap / full_gap, 1.0)
+        scores.append(1 - (1 - punctuation) * (1 - pause))
+    return scores
+
+
+def split_local(text, words, word_limit, threshold=0.5, min_words=2, full_gap=0.5):
+    """
+    根据停顿时长和标点在本地分割原文字幕，不调用 API
+    用动态规划选择断点：每多一段代价为 1，每个断点的代价为 1 减去断点得分，
+    各段词数偏离平均值时另加惩罚；最终选中的断点中有得分低于 threshold 的，视为没有把握，返回 None
+
+    :param text: 原文字幕
+    :param words: 对齐结果中的单词列表，可以为 None
+    :param word_limit: 分割后词数限制
+    :param threshold: 断点得分的最低要求
+    :param min_words: 每段最少词数，原文过短时放宽
+    :param full_gap: 得满分的停顿时长（秒）
+    :return: 分割后的原文字幕列表，拼接后与原文完全相同；没有把握时返回 None
+    """
+    matches = list(token_pattern.finditer(text))
+    tokens = [match.group() for match in matches]
+    n = len(tokens)
+    if n <= word_limit:
+        return [text]
+    scores = break_scores(tokens, word_gaps(tokens, words), full_gap)
+    if n < 2 * min_words:
+        min_words = 1
+    # 按最少段数计算的平均词数，用于均衡各段长度
+    target = n / -(-n // word_limit)
+
+    # best[j]：前 j 个词分割完成的最小代价；prev[j]：最后一段的起点
+    inf = float("inf")
+    best = [inf] * (n + 1)
+    prev = [-1] * (n + 1)
+    best[0] = 0.0
+    for j in range(min_words, n + 1):
+        for i in range(max(0, j - word_limit), j - min_words + 1):
+            if best[i] == inf:
+                continue
+            cost = best[i] + 1 + ((j - i - target) / word_limit) ** 2
+            if i > 0:
+                cost += 1 - scores[i - 1]
+            if cost < best[j]:
+                best[j] = cost
+                prev[j] = i
+    if best[n] == inf:
+        return None
+
+    breaks = []
+    j = n
+    while j > 0:
+        i = prev[j]
+        if i > 0:
+            breaks.append(i)
+        j = i
+    breaks.reverse()
+    if any(scores[i - 1] < threshold for i in breaks):
+        return None
+
+    # 每段从本段第一个词开始，空白归入前一段
+    positions = [0] + [matches[i].start() for i in breaks] + [len(text)]
+    return [text[positions[k] : positions[k + 1]] for k in range(len(positions) - 1)]
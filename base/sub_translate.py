@@ -1,8 +1,12 @@
-from base.api_request import api_request
+from base.api_router import routed_request_async, TRANSLATE, TRANSLATE_BATCH
+from base.api_engine import get_engine
+from base.api_scheduler import current_job
+from base import metrics
 from base.language_code import get_language_name
-import threading
+from base.translate_cache import cache_key
+from base.token_budget import estimate_tokens, get_limits, pack_batches
+import asyncio
 import json
-import time
 import logging
 import colorlog
 import os
@@ -107,7 +111,69 @@ EXAMPLE JSON OUTPUT:
 }
 """
 
-def translate_mono(api_key, base_url, model, src_lang, dst_lang, media_title, original, preceding, succeeding):
+prompt_targets = """
+The user will ask you to translate a video's subtitles into several languages at once. Please translate the original text reasonably based on the JSON provided. Output in JSON format.
+
+Except for special instructions, do not translate personal names. Do not translate function names or code. For place names and book titles, if there is no conventional translation, do not translate them.
+
+EXAMPLE JSON INPUT:
+{
+    "src_lang": "English",
+    "dst_langs": {
+        "zh-CN": "Simplified Chinese",
+        "ja-JP": "Japanese"
+    },
+    "title": "01 - 1.1 Course Organization (8.20 Introduction to Special Relativity)",
+    "preceding": [
+        "Welcome to Special Relativity."
+    ],
+    "original": [
+        "And let me start by wishing you all a Happy New Year 2021."
+    ],
+    "succeeding": [
+        " My name is Markus Kluter, and I will guide you through this IAP lecture on special relativity."
+    ]
+}
+
+EXAMPLE JSON OUTPUT:
+{
+    "translated": {
+        "zh-CN": [
+            "首先，让我祝大家2021年新年快乐。"
+        ],
+        "ja-JP": [
+            "まず、皆さんに2021年の新年のお祝いを申し上げます。"
+        ]
+    }
+}
+
+Your output "translated" contains one key for every key in "dst_langs". Each list contains elements that correspond one-to-one with the elements in user's input "original".
+"""
+
+async def cache_get_all(cache, keys):
+    """
+    在线程池中读取一组翻译缓存，SQLite 查询不阻塞所有文件共享的请求引擎事件循环
+    """
+    return await asyncio.to_thread(lambda: [cache.get(key) for key in keys])
+
+async def cache_put_all(cache, keys, translations):
+    """
+    在线程池中写入一组翻译缓存，空的译文不写入
+    """
+    def put():
+        for key, translation in zip(keys, translations):
+            if translation:
+                cache.put(key, translation)
+
+    await asyncio.to_thread(put)
+
+async def translate_mono_async(api_key, base_url, model, src_lang, dst_lang, media_title, original, preceding, succeeding, cache=None):
+    # 先查询翻译缓存
+    if cache is not None:
+        key = cache_key(model, src_lang, dst_lang, original, preceding, succeeding)
+        (cached,) = await cache_get_all(cache, [key])
+        if cached:
+            return cached
     message_mono = [
         {"role": "system", "content": prompt_mono},
         {
@@ -125,8 +191,10 @@ def translate_mono(api_key, base_url, model, src_lang, dst_lang, media_title, or
         },
     ]
     try:
-        response_mono = json.loads(api_request(api_key, base_url, model, message_mono))
+        response_mono = json.loads(await routed_request_async(TRANSLATE, original, api_key, base_url, model, message_mono))
         if "translated" in response_mono:
+            if cache is not None:
+                await cache_put_all(cache, [key], [response_mono["translated"]])
             return response_mono["translated"]
         else:
             logger.error(f"单条翻译失败：输出格式不正确")
@@ -135,7 +203,27 @@ def translate_mono(api_key, base_url, model, src_lang, dst_lang, media_title, or
         logger.error(f"单条翻译失败：{e}")
         return None
 
-def translate_multi(api_key, base_url, model, src_lang, dst_lang, media_title, batch, preceding, succeeding):
+def translate_mono(api_key, base_url, model, src_lang, dst_lang, media_title, original, preceding, succeeding, cache=None):
+    return get_engine(api_key, base_url).run(
+        translate_mono_async(api_key, base_url, model, src_lang, dst_lang, media_title, original, preceding, succeeding, cache)
+    )
+
+def batch_cache_keys(model, src_lang, dst_lang, batch, preceding, succeeding):
+    """
+    为批量翻译中的每一行生成缓存键，每行的上下文为请求中位于它前后的全部文本
+    """
+    return [
+        cache_key(model, src_lang, dst_lang, batch[i], preceding + batch[:i], batch[i + 1 :] + succeeding)
+        for i in range(len(batch))
+    ]
+
+async def translate_multi_async(api_key, base_url, model, src_lang, dst_lang, media_title, batch, preceding, succeeding, cache=None):
+    # 整个批次都命中缓存时不发送请求
+    if cache is not None:
+        keys = batch_cache_keys(model, src_lang, dst_lang, batch, preceding, succeeding)
+        cached = await cache_get_all(cache, keys)
+        if all(cached):
+            return cached
     messages = [
         {"role": "system", "content": prompt_multi},
         {
@@ -153,9 +241,88 @@ def translate_multi(api_key, base_url, model, src_lang, dst_lang, media_title, b
         },
     ]
     try:
-        response_json = api_request(api_key, base_url, model, messages)
+        response_json = await routed_request_async(TRANSLATE_BATCH, "\n".join(batch), api_key, base_url, model, messages)
+        response = json.loads(response_json)
+        if "translated" in response and len(response["translated"]) == len(batch):
+            if cache is not None:
+                await cache_put_all(cache, keys, response["translated"])
+            return response["translated"]
+        else:
+            logger.warning(f"批量翻译：输出输入不匹配")
+            return None
+    except Exception as e:
+        logger.error(f"批量翻译失败：{e}")
+        return None
+
+def translate_multi(api_key, base_url, model, src_lang, dst_lang, media_title, batch, preceding, succeeding, cache=None):
+    return get_engine(api_key, base_url).run(
+        translate_multi_async(api_key, base_url, model, src_lang, dst_lang, media_title, batch, preceding, succeeding, cache)
+    )
+
+def trim_history(history, model, max_tokens, request_tokens):
+    """
+    对话历史加上本轮请求超过 max_tokens 时，从最早的一轮开始丢弃，系统提示词保留
+    丢弃后请求前缀改变，这一轮只能命中系统提示词的前缀缓存，之后的轮次以新的历史为前缀
+
+    :param history: 对话历史，第一条为系统提示词，之后每轮为一条用户消息和一条模型响应，原地修改
+    :param request_tokens: 本轮用户消息和预计输出的 token 数
+    :return: 是否丢弃了历史
+    """
+    used = request_tokens + sum(estimate_tokens(message["content"], model) for message in history)
+    trimmed = False
+    while len(history) > 1 and used > max_tokens:
+        used -= sum(estimate_tokens(message["content"], model) for message in history[1:3])
+        del history[1:3]
+        trimmed = True
+    return trimmed
+
+async def translate_turn_async(api_key, base_url, model, src_lang, dst_lang, media_title, history, batch, preceding, succeeding, cache=None, send_preceding=True, max_tokens=None):
+    """
+    滑动窗口模式的一轮批量翻译：把本批次作为新的一轮用户消息追加到对话历史之后发送。
+    成功时把请求和模型的原始响应追加到 history，下一轮请求的前缀因此与本轮请求逐字节相同，
+    系统提示词和前文都可以命中服务商的前缀缓存
+
+    :param history: 对话历史，第一条为系统提示词，成功时原地追加
+    :param preceding: 前文，用于生成缓存键
+    :param send_preceding: 是否在请求中发送前文；上一批次已在历史中时前文是重复的，不再发送
+    :param max_tokens: 历史、本轮请求和预计输出的 token 上限，超过时丢弃最早的轮次，为 None 时不限制
+    :return: 译文列表，失败时返回 None
+    """
+    # 整个批次都命中缓存时不发送请求，也不改变对话历史
+    if cache is not None:
+        keys = batch_cache_keys(model, src_lang, dst_lang, batch, preceding, succeeding)
+        cached = await cache_get_all(cache, keys)
+        if all(cached):
+            return cached
+    if max_tokens is not None:
+        # 按发送前文估算；上一批次被丢弃、历史中只剩系统提示词时前文要重新发送
+        request_tokens = estimate_tokens(json.dumps(preceding + batch + succeeding), model) + 50
+        request_tokens += sum(int(estimate_tokens(text, model) * 1.5) + 4 for text in batch)
+        if trim_history(history, model, max_tokens, request_tokens) and len(history) == 1:
+            send_preceding = True
+    user_message = {
+        "role": "user",
+        "content": json.dumps(
+            {
+                "src_lang": get_language_name(src_lang),
+                "dst_lang": get_language_name(dst_lang),
+                "title": media_title,
+                "original": batch,
+                "preceding": preceding if send_preceding else [],
+                "succeeding": succeeding,
+            }
+        ),
+    }
+    try:
+        response_json = await routed_request_async(
+            TRANSLATE_BATCH, "\n".join(batch), api_key, base_url, model, history + [user_message]
+        )
         response = json.loads(response_json)
         if "translated" in response and len(response["translated"]) == len(batch):
+            history.append(user_message)
+            history.append({"role": "assistant", "content": response_json})
+            if cache is not None:
+                await cache_put_all(cache, keys, response["translated"])
             return response["translated"]
         else:
             logger.warning(f"批量翻译：输出输入不匹配")
@@ -164,6 +331,115 @@ def translate_multi(api_key, base_url, model, src_lang, dst_lang, media_title, b
         logger.error(f"批量翻译失败：{e}")
         return None
 
+async def translate_targets_async(api_key, base_url, model, src_lang, dst_langs, media_title, batch, preceding, succeeding, cache=None):
+    """
+    在一次请求中把一个批次翻译成多种语言，原文和上下文只发送一次
+    整个批次都命中缓存的语言不再请求
+
+    :param dst_langs: 目标语言列表
+    :return: 语言到译文列表的词典，只包含成功的语言
+    """
+    result = {}
+    keys = {}
+    if cache is not None:
+        for dst_lang in dst_langs:
+            keys[dst_lang] = batch_cache_keys(model, src_lang, dst_lang, batch, preceding, succeeding)
+        # 所有语言的缓存在一次线程池调用中读取
+        cached = await cache_get_all(cache, [key for dst_lang in dst_langs for key in keys[dst_lang]])
+        for position, dst_lang in enumerate(dst_langs):
+            translations = cached[position * len(batch) : (position + 1) * len(batch)]
+            if all(translations):
+                result[dst_lang] = translations
+    requested = [dst_lang for dst_lang in dst_langs if dst_lang not in result]
+    if not requested:
+        return result
+    messages = [
+        {"role": "system", "content": prompt_targets},
+        {
+            "role": "user",
+            "content": json.dumps(
+                {
+                    "src_lang": get_language_name(src_lang),
+                    "dst_langs": {dst_lang: get_language_name(dst_lang) for dst_lang in requested},
+                    "title": media_title,
+                    "original": batch,
+                    "preceding": preceding,
+                    "succeeding": succeeding,
+                }
+            ),
+        },
+    ]
+    try:
+        response = json.loads(
+            await routed_request_async(TRANSLATE_BATCH, "\n".join(batch), api_key, base_url, model, messages)
+        )
+        translated = response["translated"]
+        for dst_lang in requested:
+            translations = translated.get(dst_lang)
+            if not isinstance(translations, list) or len(translations) != len(batch):
+                logger.warning(f"多语言批量翻译：{dst_lang} 输出输入不匹配")
+                continue
+            result[dst_lang] = translations
+        if cache is not None:
+            await cache_put_all(
+                cache,
+                [key for dst_lang in requested if dst_lang in result for key in keys[dst_lang]],
+                [translation for dst_lang in requested if dst_lang in result for translation in result[dst_lang]],
+            )
+    except Exception as e:
+        logger.error(f"多语言批量翻译失败：{e}")
+    return result
+
+def budget_batches(segments, model, token_budget, max_batch_size, context_window, languages=1):
+    """
+    按 token 预算将字幕打包成批次，预算同时受模型上下文长度和最大输出长度限制
+    :param languages: 一次请求翻译的语言数，预计输出按语言数成倍增加
+    :return: 批次列表，每个批次为 (开始下标, 结束下标)
+    """
+    limits = get_limits(model)
+    token_counts = [estimate_tokens(segment["text"], model) for segment in segments]
+    # 固定开销：系统提示词、标题语言等字段以及前后文
+    average = sum(token_counts) / len(token_counts) if token_counts else 0
+    prompt = prompt_multi if languages == 1 else prompt_targets
+    overhead = estimate_tokens(prompt, model) + 50 + int(2 * context_window * average)
+    return pack_batches(
+        token_counts,
+        budget=min(token_budget, limits["context"]),
+        max_items=max_batch_size,
+        overhead=overhead,
+        output_ratio=1.5 * languages,
+        output_limit=int(limits["output"] * 0.9),
+    )
+
+def coalesce_plan(segments, coalescer, namespace, field="translation"):
+    """
+    合并重复的行：缺少译文的行中，已有译文（本文件或本次运行中）的直接填入，
+    其余相同的行只保留第一处交给 API，后面的等它翻译完再复制
+
+    :return: (合并键到代表行下标的词典, (行下标, 合并键) 形式的跟随行列表, 直接填入的行下标)
+    """
+    texts = [segment["text"] for segment in segments]
+    keys = [coalescer.key(texts, i) for i in range(len(segments))]
+    known = {}
+    for i, segment in enumerate(segments):
+        if segment.get(field):
+            known.setdefault(keys[i], segment[field])
+    representatives = {}
+    followers = []
+    filled = []
+    for i, segment in enumerate(segments):
+        if segment.get(field):
+            continue
+        translation = known.get(keys[i]) or coalescer.get(namespace, keys[i])
+        if translation:
+            segment[field] = translation
+            filled.append(i)
+        elif keys[i] in representatives:
+            followers.append((i, keys[i]))
+        else:
+            representatives[keys[i]] = i
+    return representatives, followers, filled
+
 def sub_translate(
     dict,
     api_key,
@@ -175,6 +451,15 @@ def sub_translate(
     context_window=3,
     batch_size=8,
     thread_count=10,
+    cache=None,
+    job=None,
+    journal=None,
+    token_budget=None,
+    max_batch_size=50,
+    mode="batch",
+    window_batches=8,
+    coalescer=None,
+    field="translation",
 ):
     """
     翻译字幕，处理所有数据前检测翻译是否存在，若是连续的没有翻译的原文就采用批量翻译进行翻译
@@ -187,58 +472,319 @@ def sub_translate(
     :param dst_lang: 目标语言
     :param media_title: 音视频标题
     :param context_window: 上下文长度
-    :param batch_size: 每次处理的字幕数量
-    :param thread_count: 并发线程数量
+    :param batch_size: 每次处理的字幕数量，设置 token_budget 时不使用
+    :param thread_count: 并发请求数量，所有请求在共享请求引擎的事件循环中执行
+    :param cache: 翻译缓存 TranslateCache，为 None 时不使用缓存
+    :param job: 所属任务 Job，决定请求在端点上的排队优先级，完成的字幕条数会计入其中
+    :param journal: 检查点日志 Journal，每完成一个批次就写入新得到的翻译
+    :param token_budget: 单次请求的 token 预算（输入与预计输出之和），设置后按预算动态打包批次
+    :param max_batch_size: 按 token 预算打包时每批最多条数
+    :param mode: "batch" 时每个批次独立请求；"window" 时每 window_batches 个连续批次组成一个窗口，
+        在同一段多轮对话中依次翻译，请求前缀逐字节不变，可以命中服务商的前缀缓存
+    :param window_batches: 滑动窗口模式下每个窗口的批次数，窗口越大缓存命中越多，但后面的请求越长；
+        对话历史与本轮请求超过 token_budget（未设置时为模型上下文长度）时丢弃最早的轮次
+    :param coalescer: 重复行合并 Coalescer，相同的行只翻译一次；批次仍按完整的字幕划分，
+        前后文是真实的相邻行，重复的行只是不占用批次中翻译的位置
+    :param field: 译文写入字幕的哪个字段，翻译成多种语言时每种语言使用不同的字段
     """
     segments = dict["segments"]
-    threads = []  # 初始化线程列表
 
-    def worker(index):
+    def journal_entries(indices):
+        return [
+            {
+                "index": i,
+                "text": segments[i]["text"],
+                "translation": segments[i][field],
+                "field": field,
+                "dst_lang": dst_lang,
+                "model": model,
+            }
+            for i in indices
+            if segments[i].get(field)
+        ]
+
+    def record_filled(indices):
+        # 合并得到译文的行：记录检查点和完成的工作量
+        if journal is not None:
+            journal.record("translate", journal_entries(indices))
+        if job is not None:
+            job.done(len(indices))
+
+    # 由重复行合并处理的行（直接填入或等待复制）：批次仍按完整的字幕划分，这些行只作为前后文，不占用翻译的位置
+    merged = set()
+    if coalescer is not None:
+        namespace = f"translate:{model}:{src_lang}:{dst_lang}"
+        representatives, followers, filled = coalesce_plan(segments, coalescer, namespace, field)
+        if filled or followers:
+            logger.info(f"重复行合并：{len(filled)} 条直接使用已有译文，{len(followers)} 条等待相同的行翻译后复制")
+            metrics.coalesced.inc(len(filled) + len(followers), kind="translate")
+        record_filled(filled)
+        merged = set(filled) | {i for i, _ in followers}
+
+    def slots(index, end):
+        # 批次中需要翻译的位置
+        return [i for i in range(index, end) if i not in merged]
+
+    async def translate_each(indices):
+        # 逐条翻译
+        for i in indices:
+            preceding = [segments[j]["text"] for j in range(max(0, i - context_window), i)]
+            succeeding = [segments[j]["text"] for j in range(i + 1, min(len(segments), i + 1 + context_window))]
+            translation = await translate_mono_async(api_key, base_url, model, src_lang, dst_lang, media_title, segments[i]["text"], preceding, succeeding, cache)
+            if translation:
+                segments[i][field] = translation
+            else:
+                logger.error(f"字幕翻译失败：{segments[i]["text"]}")
+
+    async def worker(index, end, window=None):
         # 检查当前批次是否有缺失的翻译
-        batch_indices = range(index, min(index + batch_size, len(segments)))
-        batch_missing = [i for i in batch_indices if "translation" not in segments[i] or not segments[i]["translation"]]
+        batch_indices = slots(index, end)
+        batch_missing = [i for i in batch_indices if not segments[i].get(field)]
+        if not batch_missing:
+            return
 
-        if len(batch_missing) == batch_size:
+        if len(batch_missing) == len(batch_indices):
             # 如果整个批次都缺失翻译，尝试批量翻译
             batch = [segments[i]["text"] for i in batch_indices]
             preceding = [segments[i]["text"] for i in range(max(0, index - context_window), index)]
-            succeeding = [segments[i]["text"] for i in range(index + batch_size, min(len(segments), index + batch_size + context_window))]
-            translations = translate_multi(api_key, base_url, model, src_lang, dst_lang, media_title, batch, preceding, succeeding)
+            succeeding = [segments[i]["text"] for i in range(end, min(len(segments), end + context_window))]
+            if window is None:
+                translations = await translate_multi_async(api_key, base_url, model, src_lang, dst_lang, media_title, batch, preceding, succeeding, cache)
+            else:
+                # 上一批次紧挨着本批次且已在对话历史中时，前文不再重复发送
+                history_length = len(window["history"])
+                translations = await translate_turn_async(
+                    api_key, base_url, model, src_lang, dst_lang, media_title, window["history"], batch, preceding, succeeding, cache,
+                    send_preceding=window["end"] != index, max_tokens=history_budget,
+                )
+                if len(window["history"]) > history_length:
+                    window["end"] = end
             if translations:
                 for i, translation in zip(batch_indices, translations):
-                    segments[i]["translation"] = translation
+                    segments[i][field] = translation
             else:
                 # 如果批量翻译失败，逐条翻译
-                for i in batch_indices:
-                    preceding = [segments[j]["text"] for j in range(max(0, i - context_window), i)]
-                    succeeding = [segments[j]["text"] for j in range(i + 1, min(len(segments), i + 1 + context_window))]
-                    translation = translate_mono(api_key, base_url, model, src_lang, dst_lang, media_title, segments[i]["text"], preceding, succeeding)
-                    if translation:
-                        segments[i]["translation"] = translation
-                    else:
-                        logger.error(f"字幕翻译失败：{segments[i]["text"]}")
+                metrics.fallbacks.inc(kind="batch_to_mono")
+                await translate_each(batch_indices)
         else:
             # 如果有部分缺失，逐条翻译缺失的部分
-            for i in batch_missing:
-                preceding = [segments[j]["text"] for j in range(max(0, i - context_window), i)]
-                succeeding = [segments[j]["text"] for j in range(i + 1, min(len(segments), i + 1 + context_window))]
-                translation = translate_mono(api_key, base_url, model, src_lang, dst_lang, media_title, segments[i]["text"], preceding, succeeding)
-                if translation:
-                    segments[i]["translation"] = translation
-                else:
-                    logger.error(f"字幕翻译失败：{segments[i]["text"]}")
-
-    for i in range(0, len(segments), batch_size):
-        # 如果当前线程数达到上限，等待至少一个线程完成
-        while len(threads) >= thread_count:
-            for t in threads:
-                if not t.is_alive():  # 检查线程是否完成
-                    threads.remove(t)  # 从线程列表中移除
-            time.sleep(0.1)  # 避免忙等待
-        t = threading.Thread(target=worker, args=[i])
-        threads.append(t)
-        t.start()
-
-    # 等待剩余线程完成
-    for t in threads:
-        t.join()
\ No newline at end of file
+            await translate_each(batch_missing)
+
+    async def finish(index, end, missing):
+        # 记录检查点和完成的工作量
+        if journal is not None:
+            await journal.record_async("translate", journal_entries(missing))
+        if job is not None:
+            job.done(len(slots(index, end)))
+
+    async def run_all():
+        if job is not None:
+            current_job.set(job)
+        # 用信号量限制同时进行的批次数量
+        semaphore = asyncio.Semaphore(thread_count)
+
+        async def guarded_worker(index, end, window=None):
+            # 一个批次出错不影响其他批次，出错批次中没有译文的行留给之后的检查和重新翻译
+            try:
+                await worker(index, end, window)
+            except Exception as e:
+                logger.error(f"批次翻译失败（第 {index} 至 {end - 1} 条）：{e}")
+
+        async def bounded_worker(index, end):
+            missing = [i for i in slots(index, end) if not segments[i].get(field)]
+            async with semaphore:
+                await guarded_worker(index, end)
+            await finish(index, end, missing)
+
+        async def bounded_window(window_batches):
+            # 窗口内的批次按顺序在同一段对话中翻译，不同窗口并发
+            window = {"history": [{"role": "system", "content": prompt_multi}], "end": None}
+            async with semaphore:
+                for index, end in window_batches:
+                    missing = [i for i in slots(index, end) if not segments[i].get(field)]
+                    await guarded_worker(index, end, window)
+                    await finish(index, end, missing)
+
+        if mode == "window":
+            windows = [batches[i : i + window_batches] for i in range(0, len(batches), window_batches)]
+            results = await asyncio.gather(*(bounded_window(window) for window in windows), return_exceptions=True)
+        else:
+            results = await asyncio.gather(*(bounded_worker(start, end) for start, end in batches), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"字幕翻译失败：{result}")
+
+    # 滑动窗口模式下对话历史与本轮请求之和的上限
+    history_budget = get_limits(model)["context"]
+    if token_budget:
+        history_budget = min(token_budget, history_budget)
+        batches = budget_batches(segments, model, token_budget, max_batch_size, context_window)
+    else:
+        batches = [
+            (i, min(i + batch_size, len(segments))) for i in range(0, len(segments), batch_size)
+        ]
+
+    get_engine(api_key, base_url).run(run_all())
+
+    if coalescer is not None:
+        # 把代表行的译文分发给相同的行，并留给之后的文件
+        for key, i in representatives.items():
+            if segments[i].get(field):
+                coalescer.put(namespace, key, segments[i][field])
+        copied = []
+        for i, key in followers:
+            translation = segments[representatives[key]].get(field)
+            if translation:
+                segments[i][field] = translation
+                copied.append(i)
+            else:
+                logger.error(f"字幕翻译失败：{segments[i]['text']}")
+        record_filled(copied)
+        if job is not None:
+            job.done(len(followers) - len(copied))
+
+def translation_field(dst_lang, dst_langs):
+    """
+    译文保存的字段：第一种目标语言为 translation，与只翻译一种语言时相同，其余为 translation:语言
+    """
+    return "translation" if dst_lang == dst_langs[0] else f"translation:{dst_lang}"
+
+def sub_translate_targets(
+    dict,
+    api_key,
+    base_url,
+    model,
+    src_lang,
+    dst_langs,
+    media_title,
+    combine=True,
+    context_window=3,
+    batch_size=8,
+    thread_count=10,
+    cache=None,
+    job=None,
+    journal=None,
+    coalescer=None,
+    **kwargs,
+):
+    """
+    把字幕翻译成多种语言，每种语言的译文保存在 translation_field 给出的字段中
+
+    combine 为 True 时先把缺失译文的连续字幕按批次一次请求多种语言，每个批次只请求其中有缺失的语言，
+    然后每种语言再用 sub_translate 补齐失败的部分（沿用其缓存、重复行合并、检查点和逐条回退）
+
+    :param dst_langs: 目标语言列表
+    :param combine: 是否在一次请求中翻译多种语言
+    :param kwargs: 传给 sub_translate 的其他参数，其中的 token_budget 和 max_batch_size 同样用于多语言批次
+    """
+    if combine and len(dst_langs) > 1:
+        segments = dict["segments"]
+        fields = {dst_lang: translation_field(dst_lang, dst_langs) for dst_lang in dst_langs}
+        texts = [segment["text"] for segment in segments]
+        # 每行缺失译文的语言
+        missing = [tuple(dst_lang for dst_lang in dst_langs if not segment.get(fields[dst_lang])) for segment in segments]
+        # 相同的行只请求第一处，其余的由之后每种语言的 sub_translate 从 coalescer 中取得
+        followers = set()
+        if coalescer is not None:
+            seen = set()
+            for i in range(len(segments)):
+                if missing[i]:
+                    key = coalescer.key(texts, i)
+                    if key in seen:
+                        followers.add(i)
+                    seen.add(key)
+
+        # 缺失相同语言的连续行组成一段，每段内按 token 预算（未设置时按条数）分批，
+        # 批次和前后文都是原字幕中连续的行，每个批次只请求这一段缺失的语言
+        token_budget = kwargs.get("token_budget")
+        batches = []
+        start = 0
+        while start < len(segments):
+            langs = missing[start]
+            end = start + 1
+            while end < len(segments) and missing[end] == langs:
+                end += 1
+            if langs and token_budget:
+                batches.extend(
+                    (start + lower, start + upper, langs)
+                    for lower, upper in budget_batches(
+                        segments[start:end], model, token_budget, kwargs.get("max_batch_size", 50), context_window, len(langs)
+                    )
+                )
+            elif langs:
+                # 每条字幕要输出多种语言的译文，批次相应减小
+                step = max(1, batch_size // len(langs))
+                batches.extend((i, min(i + step, end), langs) for i in range(start, end, step))
+            start = end
+
+        async def worker(start, end, langs):
+            indices = [i for i in range(start, end) if i not in followers]
+            if not indices:
+                return
+            batch = [texts[i] for i in indices]
+            preceding = texts[max(0, start - context_window) : start]
+            succeeding = texts[end : end + context_window]
+            result = await translate_targets_async(
+                api_key, base_url, model, src_lang, list(langs), media_title, batch, preceding, succeeding, cache
+            )
+            for dst_lang, translations in result.items():
+                field = fields[dst_lang]
+                filled = []
+                for i, translation in zip(indices, translations):
+                    if translation and not segments[i].get(field):
+                        segments[i][field] = translation
+                        filled.append(i)
+                        if coalescer is not None:
+                            coalescer.put(f"translate:{model}:{src_lang}:{dst_lang}", coalescer.key(texts, i), translation)
+                if journal is not None:
+                    await journal.record_async(
+                        "translate",
+                        [
+                            {"index": i, "text": texts[i], "translation": segments[i][field], "field": field, "dst_lang": dst_lang, "model": model}
+                            for i in filled
+                        ],
+                    )
+
+        async def run_all():
+            if job is not None:
+                current_job.set(job)
+            semaphore = asyncio.Semaphore(thread_count)
+
+            async def bounded_worker(start, end, langs):
+                try:
+                    async with semaphore:
+                        await worker(start, end, langs)
+                except Exception as e:
+                    # 出错批次的行留给之后每种语言的 sub_translate 翻译
+                    logger.error(f"多语言批次翻译失败（第 {start} 至 {end - 1} 条）：{e}")
+
+            results = await asyncio.gather(
+                *(bounded_worker(start, end, langs) for start, end, langs in batches),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"多语言翻译失败：{result}")
+
+        if batches:
+            get_engine(api_key, base_url).run(run_all())
+
+    for dst_lang in dst_langs:
+        sub_translate(
+            dict,
+            api_key,
+            base_url,
+            model,
+            src_lang,
+            dst_lang,
+            media_title,
+            context_window=context_window,
+            batch_size=batch_size,
+            thread_count=thread_count,
+            cache=cache,
+            job=job,
+            journal=journal,
+            coalescer=coalescer,
+            field=translation_field(dst_lang, dst_langs),
+            **kwargs,
+        )
@@ -0,0 +1,102 @@
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 各模型的上下文长度和最大输出长度（token）
+model_limits = {
+    "deepseek-chat": {"context": 65536, "output": 8192},
+    "deepseek-reasoner": {"context": 65536, "output": 8192},
+    "gpt-4o": {"context": 128000, "output": 16384},
+    "gpt-4o-mini": {"context": 128000, "output": 16384},
+    "gpt-4.1": {"context": 1047576, "output": 32768},
+    "gpt-4.1-mini": {"context": 1047576, "output": 32768},
+}
+default_limits = {"context": 8192, "output": 4096}
+
+# 中日韩字符，没有分词器时按每字一个 token 估算
+cjk_pattern = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+encoders = {}
+encoders_lock = threading.Lock()
+
+
+def get_limits(model):
+    """
+    获取模型的 token 限制
+    :return: 包含 context 和 output 的词典
+    """
+    return model_limits.get(model, default_limits)
+
+
+def get_encoder(model):
+    """
+    获取模型对应的 tiktoken 编码器，没有安装 tiktoken 或无法加载时返回 None
+    非 OpenAI 模型使用 o200k_base 近似
+    """
+    if tiktoken is None:
+        return None
+    with encoders_lock:
+        if model in encoders:
+            return encoders[model]
+        try:
+            encoder = tiktoken.encoding_for_model(model)
+        except KeyError:
+            try:
+                encoder = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                encoder = None
+        except Exception:
+            encoder = None
+        encoders[model] = encoder
+        return encoder
+
+
+def estimate_tokens(text, model=None):
+    """
+    估计文本的 token 数
+    有 tiktoken 时使用本地分词器，否则中日韩字符按一字一个 token、其余字符按四个一个 token 估算
+    """
+    encoder = get_encoder(model)
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    cjk_count = len(cjk_pattern.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def pack_batches(token_counts, budget, max_items=None, overhead=0, output_ratio=1.5, item_overhead=4, output_limit=None):
+    """
+    按 token 预算将连续的条目打包成批次，每个批次至少一条
+
+    :param token_counts: 每条原文的 token 数
+    :param budget: 单次请求的 token 预算（输入与预计输出之和）
+    :param max_items: 每批最多条数，为 None 时不限制
+    :param overhead: 每次请求固定的输入 token 数（系统提示词、上下文等）
+    :param output_ratio: 预计输出 token 数与原文 token 数之比
+    :param item_overhead: 每条在输入和输出 JSON 中的额外 token 数
+    :param output_limit: 单次请求最大输出 token 数，为 None 时不限制
+    :return: 批次列表，每个批次为 (开始下标, 结束下标)
+    """
+    batches = []
+    start = 0
+    n = len(token_counts)
+    while start < n:
+        end = start
+        used = overhead
+        output = 0
+        while end < n and (max_items is None or end - start < max_items):
+            item_input = token_counts[end] + item_overhead
+            item_output = int(token_counts[end] * output_ratio) + item_overhead
+            over_budget = used + item_input + output + item_output > budget
+            over_output = output_limit is not None and output + item_output > output_limit
+            if end > start and (over_budget or over_output):
+                break
+            used += item_input
+            output += item_output
+            end += 1
+        batches.append((start, end))
+        start = end
+    return batches
@@ -0,0 +1,92 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+# 工作进程中的模型和转录参数，由 init_worker 加载一次，之后每个文件复用
+worker_state = {}
+
+
+def init_worker(threads, model_options, transcribe_options):
+    """
+    工作进程初始化：固定 CPU 线程数，然后加载 Whisper 和对齐模型
+    线程数相关的环境变量必须在导入 torch 等库之前设置
+    """
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(threads)
+    import torch
+    import whisperX.whisperx as wsx
+
+    torch.set_num_threads(threads)
+    device = model_options["device"]
+    worker_state["whisper_model"] = wsx.load_model(
+        model_options["whisper_model_type"],
+        device,
+        compute_type=model_options["compute_type"],
+        download_root=model_options["whisper_model_dir"],
+        threads=threads,
+    )
+    worker_state["align_model"], worker_state["metadata"] = wsx.load_align_model(
+        language_code=model_options["language"],
+        device=device,
+        model_name=model_options.get("align_model_name"),
+        model_dir=model_options["align_model_dir"],
+    )
+    worker_state["device"] = device
+    worker_state["options"] = transcribe_options
+
+
+def transcribe_worker(input_path):
+    """
+    在工作进程中转录一个文件
+    :return: (transcript, aligned)
+    """
+    from base.media_transcribe import transcribe_batch, transcribe_stream
+
+    options = dict(worker_state["options"])
+    window = options.pop("window", None)
+    overlap = options.pop("overlap", None)
+    models = {
+        "device": worker_state["device"],
+        "whisper_model": worker_state["whisper_model"],
+        "align_model": worker_state["align_model"],
+        "metadata": worker_state["metadata"],
+    }
+    if window:
+        return transcribe_stream(input_path, window=window, overlap=overlap, **models, **options)
+    return transcribe_batch(input_path, **models, **options)
+
+
+class TranscribePool:
+    """
+    多进程转录：每个工作进程加载一次模型并固定 CPU 线程数，从共享队列中取文件转录；
+    流水线的每个转录线程调用 transcribe 提交一个文件并等待结果
+    """
+
+    def __init__(self, processes, threads, model_options, transcribe_options):
+        """
+        :param processes: 工作进程数
+        :param threads: 每个工作进程使用的 CPU 线程数
+        :param model_options: 模型参数，包含 device、whisper_model_type、compute_type、whisper_model_dir、language、align_model_name、align_model_dir
+        :param transcribe_options: 转录参数，包含 batch_size、language，以及分窗口转录的 window、overlap
+        """
+        self.processes = processes
+        # 使用 spawn，工作进程不继承主进程的线程和请求引擎
+        self.executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(threads, model_options, transcribe_options),
+        )
+
+    def transcribe(self, input_path):
+        """
+        在空闲的工作进程中转录一个文件，阻塞直到完成
+        :return: (transcript, aligned)
+        """
+        return self.executor.submit(transcribe_worker, input_path).result()
+
+    def close(self):
+        """
+        关闭进程池，等待工作进程退出
+        """
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,319 @@
+import json
+import struct
+
+import numpy as np
+
+# 二进制格式：魔数、头部长度、JSON 头部，之后是按 64 字节对齐的各列原始数据
+magic = b"TFTS0001"
+alignment = 64
+# 单词的时间和得分列，缺失的值用 NaN 表示
+word_columns = ("start", "end", "score")
+
+
+class Words:
+    """
+    一条字幕的单词列表视图，按下标返回 Word
+    """
+
+    __slots__ = ("transcript", "begin", "stop")
+
+    def __init__(self, transcript, begin, stop):
+        self.transcript = transcript
+        self.begin = begin
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.begin
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return Word(self.transcript, self.begin + index)
+
+    def __iter__(self):
+        for index in range(self.begin, self.stop):
+            yield Word(self.transcript, index)
+
+    def __bool__(self):
+        return self.stop > self.begin
+
+
+class Word:
+    """
+    单个单词的词典视图，读写都直接作用于列数据
+    """
+
+    __slots__ = ("transcript", "index")
+
+    def __init__(self, transcript, index):
+        self.transcript = transcript
+        self.index = index
+
+    def keys(self):
+        keys = ["word"]
+        for key in word_columns:
+            if not np.isnan(self.transcript.word_arrays[key][self.index]):
+                keys.append(key)
+        extra = self.transcript.word_extras.get(self.index)
+        if extra:
+            keys.extend(key for key in extra if key not in keys)
+        return keys
+
+    def __getitem__(self, key):
+        extra = self.transcript.word_extras.get(self.index)
+        if extra and key in extra:
+            return extra[key]
+        if key == "word":
+            return self.transcript.word_text(self.index)
+        if key in word_columns:
+            value = self.transcript.word_arrays[key][self.index]
+            if not np.isnan(value):
+                return float(value)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in word_columns and isinstance(value, (int, float)):
+            self.transcript.word_arrays[key][self.index] = value
+        else:
+            self.transcript.word_extras.setdefault(self.index, {})[key] = value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return {key: self[key] for key in self.keys()}
+
+
+class Segment:
+    """
+    一条字幕的词典视图：字幕级的字段（start、end、text、translation 等）保存在小词典中，
+    words 返回指向列数据的 Words
+    """
+
+    __slots__ = ("transcript", "fields", "begin", "stop")
+
+    def __init__(self, transcript, fields, begin, stop):
+        self.transcript = transcript
+        self.fields = fields
+        self.begin = begin
+        self.stop = stop
+
+    def keys(self):
+        return list(self.fields) + ["words"]
+
+    def __getitem__(self, key):
+        if key == "words":
+            return Words(self.transcript, self.begin, self.stop)
+        return self.fields[key]
+
+    def __setitem__(self, key, value):
+        if key == "words":
+            raise TypeError("不能替换列式转录中的单词列表")
+        self.fields[key] = value
+
+    def __contains__(self, key):
+        return key == "words" or key in self.fields
+
+    def get(self, key, default=None):
+        if key == "words":
+            return self["words"]
+        return self.fields.get(key, default)
+
+    def pop(self, key, *default):
+        return self.fields.pop(key, *default)
+
+    def to_dict(self):
+        result = dict(self.fields)
+        result["words"] = [word.to_dict() for word in self["words"]]
+        return result
+
+
+class ColumnarTranscript:
+    """
+    列式存储的对齐转录结果
+    所有单词的文本存放在一个 UTF-8 字节表中，时间和得分是 float64 数组，每个单词不再是一个词典；
+    通过 transcript["segments"] 得到的 Segment、Words、Word 提供与原词典相同的读写接口，已有代码无需修改
+    """
+
+    def __init__(self, meta, segment_fields, word_bounds, text_offsets, text_blob, word_arrays, word_extras=None):
+        """
+        :param meta: segments 之外的顶层字段
+        :param segment_fields: 每条字幕除 words 外的字段
+        :param word_bounds: 每条字幕的单词在列中的起止下标，长度为字幕数加一
+        :param text_offsets: 每个单词在字节表中的起止位置，长度为单词数加一
+        :param text_blob: 单词文本的 UTF-8 字节表（uint8 数组）
+        :param word_arrays: 列名到 float64 数组的词典
+        :param word_extras: 单词下标到额外字段的词典
+        """
+        self.meta = meta
+        self.word_bounds = word_bounds
+        self.text_offsets = text_offsets
+        self.text_blob = text_blob
+        self.word_arrays = word_arrays
+        self.word_extras = word_extras or {}
+        self.segments = [
+            Segment(self, fields, int(word_bounds[i]), int(word_bounds[i + 1]))
+            for i, fields in enumerate(segment_fields)
+        ]
+
+    def __getitem__(self, key):
+        if key == "segments":
+            return self.segments
+        return self.meta[key]
+
+    def __setitem__(self, key, value):
+        if key == "segments":
+            raise TypeError("不能替换列式转录中的字幕列表")
+        self.meta[key] = value
+
+    def __contains__(self, key):
+        return key == "segments" or key in self.meta
+
+    def get(self, key, default=None):
+        if key == "segments":
+            return self.segments
+        return self.meta.get(key, default)
+
+    def word_text(self, index):
+        start, end = self.text_offsets[index], self.text_offsets[index + 1]
+        return bytes(self.text_blob[start:end]).decode("utf-8")
+
+    @classmethod
+    def from_dict(cls, transcript):
+        """
+        由词典形式的转录结果创建
+        """
+        segment_fields = []
+        word_bounds = [0]
+        texts = []
+        columns = {key: [] for key in word_columns}
+        word_extras = {}
+        for segment in transcript["segments"]:
+            segment_fields.append({key: value for key, value in segment.items() if key != "words"})
+            for word in segment.get("words", []):
+                index = len(texts)
+                texts.append(word.get("word", "").encode("utf-8"))
+                for key in word_columns:
+                    value = word.get(key)
+                    columns[key].append(value if isinstance(value, (int, float)) else np.nan)
+                extra = {key: value for key, value in word.items() if key != "word" and key not in word_columns}
+                if extra:
+                    word_extras[index] = extra
+            word_bounds.append(len(texts))
+        text_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in texts], out=text_offsets[1:])
+        text_blob = np.frombuffer(b"".join(texts), dtype=np.uint8).copy()
+        word_arrays = {key: np.array(columns[key], dtype=np.float64) for key in word_columns}
+        meta = {key: value for key, value in transcript.items() if key != "segments"}
+        return cls(
+            meta,
+            segment_fields,
+            np.array(word_bounds, dtype=np.int64),
+            text_offsets,
+            text_blob,
+            word_arrays,
+            word_extras,
+        )
+
+    def to_dict(self):
+        """
+        转换为词典形式，用于 JSON 序列化
+        """
+        result = dict(self.meta)
+        result["segments"] = [segment.to_dict() for segment in self.segments]
+        return result
+
+    def save(self, path):
+        """
+        保存为二进制文件
+        """
+        arrays = {
+            "word_bounds": self.word_bounds,
+            "text_offsets": self.text_offsets,
+            "text_blob": self.text_blob,
+        }
+        for key in word_columns:
+            arrays["word_" + key] = self.word_arrays[key]
+        columns = {}
+        offset = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            columns[name] = {"dtype": array.dtype.str, "length": len(array), "offset": offset}
+            offset += -(-array.nbytes // alignment) * alignment
+        header = json.dumps(
+            {
+                "meta": self.meta,
+                "segments": [segment.fields for segment in self.segments],
+                "word_extras": {str(index): extra for index, extra in self.word_extras.items()},
+                "columns": columns,
+            },
+            ensure_ascii=False,
+        ).encode("utf-8")
+        # 列数据从对齐的位置开始，内存映射后可以直接作为数组使用
+        data_start = -(-(len(magic) + 8 + len(header)) // alignment) * alignment
+        with open(path, "wb") as f:
+            f.write(magic)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for name, array in arrays.items():
+                f.seek(data_start + columns[name]["offset"])
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(data_start + offset)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        读取二进制文件
+        :param mmap: 是否内存映射列数据；映射为写时复制，修改不会写回文件
+        """
+        with open(path, "rb") as f:
+            if f.read(len(magic)) != magic:
+                raise ValueError(f"不是列式转录文件：{path}")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length).decode("utf-8"))
+        data_start = -(-(len(magic) + 8 + header_length) // alignment) * alignment
+        arrays = {}
+        for name, column in header["columns"].items():
+            dtype = np.dtype(column["dtype"])
+            if column["length"] == 0:
+                arrays[name] = np.zeros(0, dtype=dtype)
+            elif mmap:
+                arrays[name] = np.memmap(
+                    path, dtype=dtype, mode="c", offset=data_start + column["offset"], shape=(column["length"],)
+                )
+            else:
+                arrays[name] = np.fromfile(
+                    path, dtype=dtype, count=column["length"], offset=data_start + column["offset"]
+                )
+        return cls(
+            header["meta"],
+            header["segments"],
+            arrays["word_bounds"],
+            arrays["text_offsets"],
+            arrays["text_blob"],
+            {key: arrays["word_" + key] for key in word_columns},
+            {int(index): extra for index, extra in header["word_extras"].items()},
+        )
+
+
+def to_plain(transcript):
+    """
+    转换为可以 JSON 序列化的词典，已经是词典时原样返回
+    """
+    if isinstance(transcript, ColumnarTranscript):
+        return transcript.to_dict()
+    return transcript
@@ -0,0 +1,132 @@
+import sqlite3
+import hashlib
+import threading
+import json
+import time
+import os
+
+
+def context_hash(preceding, succeeding):
+    """
+    计算上下文的哈希值
+    :param preceding: 前文列表
+    :param succeeding: 后文列表
+    :return: 十六进制哈希字符串
+    """
+    payload = json.dumps([preceding, succeeding], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_key(model, src_lang, dst_lang, original, preceding, succeeding):
+    """
+    生成翻译缓存的键：模型、源语言、目标语言、原文和上下文哈希
+    :return: 十六进制哈希字符串
+    """
+    payload = json.dumps(
+        [model, src_lang, dst_lang, original, context_hash(preceding, succeeding)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranslateCache:
+    """
+    以内容为键的持久化翻译缓存，存储在 SQLite 中
+    按条目数量和存活时间淘汰旧条目
+    """
+
+    def __init__(self, path, max_entries=200000, max_age=30 * 24 * 3600, evict_interval=500):
+        """
+        :param path: SQLite 数据库路径
+        :param max_entries: 最大缓存条目数，超出时淘汰最久未访问的条目
+        :param max_age: 条目最长存活秒数，为 None 时不按时间淘汰
+        :param evict_interval: 每写入多少条执行一次淘汰
+        """
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                translation TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS translations_accessed ON translations (accessed)"
+        )
+
+    def get(self, key):
+        """
+        读取缓存的翻译，不存在或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT translation, created FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            translation, created = row
+            if self.max_age is not None and now - created > self.max_age:
+                self._conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE translations SET accessed = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(translation)
+
+    def put(self, key, translation):
+        """
+        写入翻译结果
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations (key, translation, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(translation, ensure_ascii=False), now, now),
+            )
+            self._puts += 1
+            if self._puts % self.evict_interval == 0:
+                self._evict(now)
+
+    def evict(self):
+        """
+        立即执行一次淘汰
+        """
+        with self._lock:
+            self._evict(time.time())
+
+    def _evict(self, now):
+        # 淘汰过期条目
+        if self.max_age is not None:
+            self._conn.execute(
+                "DELETE FROM translations WHERE created < ?", (now - self.max_age,)
+            )
+        # 淘汰超出数量上限的最久未访问条目
+        if self.max_entries is not None:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    """
+                    DELETE FROM translations WHERE key IN (
+                        SELECT key FROM translations ORDER BY accessed ASC LIMIT ?
+                    )
+                    """,
+                    (count - self.max_entries,),
+                )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,299 @@
+"""
+字幕流水线 CPU 热点的微基准测试
+
+在仓库根目录运行：
+    python -m bench.bench_subtitle --segments 500 --words 20 --cjk-ratio 0.1
+    python -m bench.bench_subtitle --save main        # 保存基线到 bench/baselines/main.json
+    python -m bench.bench_subtitle --compare main     # 与基线比较，有回退时退出码为 1
+"""
+from bench.synthetic import make_transcript, make_llm_pieces, add_segmentation
+
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+baseline_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def case_align_segments(transcript, reference=False):
+    from base.sub_segment import align_segments, align_segments_reference
+
+    rng = random.Random(1)
+    pairs = [
+        (segment["text"], make_llm_pieces(rng, segment["text"], 8))
+        for segment in transcript["segments"]
+    ]
+    func = align_segments_reference if reference else align_segments
+
+    def setup():
+        return pairs
+
+    def run(state):
+        for text, pieces in state:
+            func(text, pieces)
+
+    return setup, run
+
+
+def case_split_translated(transcript):
+    from base.sub_segment import split_translated
+
+    rng = random.Random(2)
+    pairs = [
+        (segment["translation"], rng.randint(1, 5)) for segment in transcript["segments"]
+    ]
+
+    def setup():
+        return pairs
+
+    def run(state):
+        for text, count in state:
+            split_translated(text, count)
+
+    return setup, run
+
+
+def case_dist_prop(transcript):
+    from base.sub_segment import dist_prop
+
+    rng = random.Random(3)
+    inputs = []
+    for segment in transcript["segments"]:
+        arr = [rng.randint(1, 20) for _ in range(rng.randint(1, 6))]
+        # 与 split_translated 中一样，分配总数总是大于数组长度
+        inputs.append((arr, len(arr) + rng.randint(1, 6)))
+
+    def setup():
+        return inputs
+
+    def run(state):
+        for arr, count in state:
+            dist_prop(arr, count, 1)
+
+    return setup, run
+
+
+def case_split_local(transcript):
+    from base.sub_split import split_local
+
+    pairs = [(segment["text"], segment["words"]) for segment in transcript["segments"]]
+
+    def setup():
+        return pairs
+
+    def run(state):
+        for text, words in state:
+            split_local(text, words, 12)
+
+    return setup, run
+
+
+def case_merge_punctuation(transcript):
+    from base.sub_segment import merge_punctuation
+    import jieba
+
+    words = [list(jieba.cut(segment["translation"], cut_all=False)) for segment in transcript["segments"]]
+
+    def setup():
+        return words
+
+    def run(state):
+        for item in state:
+            merge_punctuation(item)
+
+    return setup, run
+
+
+def case_fill_missing_times(transcript):
+    from base.media_transcribe import fill_missing_times
+
+    def setup():
+        return copy.deepcopy(transcript)
+
+    def run(state):
+        for segment in state["segments"]:
+            fill_missing_times(segment)
+
+    return setup, run
+
+
+def case_fill_missing_times_columnar(transcript):
+    from base.media_transcribe import fill_missing_times_bulk
+    from base.transcript_store import ColumnarTranscript
+
+    def setup():
+        return ColumnarTranscript.from_dict(transcript)
+
+    def run(state):
+        fill_missing_times_bulk(state)
+
+    return setup, run
+
+
+def case_sub_optimize(transcript):
+    from base.sub_optimize import sub_optimize
+
+    segmented = add_segmentation(copy.deepcopy(transcript))
+
+    def setup():
+        return copy.deepcopy(segmented)
+
+    def run(state):
+        sub_optimize(state, src_lang="en-US", dst_lang="zh-CN")
+
+    return setup, run
+
+
+def case_generate_bilingual_srt(transcript, out_dir):
+    from base.media_transcribe import fill_missing_times
+    from base.srt_generate import generate_bilingual_srt
+
+    segmented = add_segmentation(copy.deepcopy(transcript))
+    for segment in segmented["segments"]:
+        fill_missing_times(segment)
+    srt_path = os.path.join(out_dir, "bench.srt")
+
+    def setup():
+        return segmented
+
+    def run(state):
+        generate_bilingual_srt(state, srt_path)
+
+    return setup, run
+
+
+def case_convert_srt_to_ass(transcript, out_dir):
+    from base.media_transcribe import fill_missing_times
+    from base.srt_generate import generate_bilingual_srt
+    from base.srt2ass import convert_srt_to_ass
+    import pysubs2
+
+    segmented = add_segmentation(copy.deepcopy(transcript))
+    for segment in segmented["segments"]:
+        fill_missing_times(segment)
+    srt_path = os.path.join(out_dir, "bench_ass.srt")
+    ass_path = os.path.join(out_dir, "bench.ass")
+    generate_bilingual_srt(segmented, srt_path)
+    style = pysubs2.SSAStyle()
+
+    def setup():
+        return srt_path
+
+    def run(state):
+        convert_srt_to_ass(state, ass_path, original_style=style, translated_style=style)
+
+    return setup, run
+
+
+def build_cases(transcript, out_dir, with_reference):
+    cases = {
+        "align_segments": lambda: case_align_segments(transcript),
+        "split_translated": lambda: case_split_translated(transcript),
+        "dist_prop": lambda: case_dist_prop(transcript),
+        "split_local": lambda: case_split_local(transcript),
+        "merge_punctuation": lambda: case_merge_punctuation(transcript),
+        "fill_missing_times": lambda: case_fill_missing_times(transcript),
+        "fill_missing_times_columnar": lambda: case_fill_missing_times_columnar(transcript),
+        "sub_optimize": lambda: case_sub_optimize(transcript),
+        "generate_bilingual_srt": lambda: case_generate_bilingual_srt(transcript, out_dir),
+        "convert_srt_to_ass": lambda: case_convert_srt_to_ass(transcript, out_dir),
+    }
+    if with_reference:
+        cases["align_segments_reference"] = lambda: case_align_segments(transcript, reference=True)
+    return cases
+
+
+def measure(setup, run, repeat):
+    """
+    计时（每次重新准备输入，准备时间不计入）并测量一次运行的峰值内存
+    先预热一次，排除 jieba 词典加载等一次性开销
+    :return: 最短时间、平均时间（秒）和峰值内存（字节）
+    """
+    run(setup())
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    state = setup()
+    tracemalloc.start()
+    run(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"best": min(times), "mean": sum(times) / len(times), "peak": peak}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="字幕流水线 CPU 热点的微基准测试")
+    parser.add_argument("--segments", type=int, default=300, help="字幕条数")
+    parser.add_argument("--words", type=int, default=20, help="每条字幕的平均词数")
+    parser.add_argument("--cjk-ratio", type=float, default=0.0, help="原文中中文词的比例")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--only", nargs="*", help="只运行指定的项目")
+    parser.add_argument("--reference", action="store_true", help="同时测试 align_segments_reference")
+    parser.add_argument("--save", metavar="NAME", help="保存结果为基线 bench/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="与基线 bench/baselines/NAME.json 比较")
+    parser.add_argument("--threshold", type=float, default=1.25, help="最短时间或峰值内存超过基线的倍数时视为回退")
+    args = parser.parse_args(argv)
+
+    params = {
+        "segments": args.segments,
+        "words": args.words,
+        "cjk_ratio": args.cjk_ratio,
+        "seed": args.seed,
+    }
+    transcript = make_transcript(args.segments, args.words, args.cjk_ratio, seed=args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(baseline_dir, args.compare + ".json"), "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["params"] != params:
+            print(f"警告：基线参数 {baseline['params']} 与本次参数 {params} 不同")
+
+    results = {}
+    regressions = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name, build in build_cases(transcript, out_dir, args.reference).items():
+            if args.only and name not in args.only:
+                continue
+            try:
+                setup, run = build()
+            except ImportError as e:
+                print(f"{name:<26} 跳过：{e}")
+                continue
+            result = measure(setup, run, args.repeat)
+            results[name] = result
+            line = f"{name:<26} best {result['best'] * 1000:10.2f} ms  mean {result['mean'] * 1000:10.2f} ms  peak {result['peak'] / 1024:10.1f} KiB"
+            if baseline and name in baseline["results"]:
+                base = baseline["results"][name]
+                time_ratio = result["best"] / base["best"] if base["best"] else 1
+                peak_ratio = result["peak"] / base["peak"] if base["peak"] else 1
+                line += f"  time x{time_ratio:.2f}  peak x{peak_ratio:.2f}"
+                if time_ratio > args.threshold or peak_ratio > args.threshold:
+                    regressions.append(name)
+                    line += "  回退"
+            print(line)
+
+    if args.save:
+        os.makedirs(baseline_dir, exist_ok=True)
+        with open(os.path.join(baseline_dir, args.save + ".json"), "w", encoding="utf-8") as f:
+            json.dump({"params": params, "python": sys.version, "results": results}, f, indent=2)
+        print(f"基线已保存：{args.save}")
+
+    if regressions:
+        print(f"性能回退：{', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import random
+
+latin_words = (
+    "the of and to a in is you that it he was for on are as with his they I at be this have "
+    "from or one had by word but not what all were we when your can said there use an each "
+    "which she do how their if will up other about out many then them these so some her would "
+    "make like him into time has look two more write go see number no way could people my than "
+    "first water been call who oil its now find long down day did get come made may part "
+    "relativity lecture function Lorentz transformation velocity observer frame"
+).split()
+cjk_words = (
+    "我们 今天 讨论 相对论 观察者 参考系 速度 光速 时间 空间 变换 函数 因为 所以 但是 "
+    "这个 那个 问题 答案 实验 物理 课程 老师 学生 非常 重要 理解 计算 结果 方法"
+).split()
+latin_punctuation = [",", ".", "?", ";", ":", "!"]
+cjk_punctuation = ["，", "。", "？", "；", "：", "！", "、"]
+
+
+def make_sentence(rng, word_count, cjk_ratio):
+    """
+    生成一句带标点的原文，cjk_ratio 为其中中文词的比例
+    """
+    words = []
+    for i in range(word_count):
+        if rng.random() < cjk_ratio:
+            word = rng.choice(cjk_words)
+        else:
+            word = rng.choice(latin_words)
+        if i < word_count - 1 and rng.random() < 0.12:
+            word += rng.choice(latin_punctuation[:2])
+        words.append(word)
+    return " ".join(words) + rng.choice(latin_punctuation[1:3])
+
+
+def make_translation(rng, word_count):
+    """
+    生成一句中文译文，词数与原文大致相同
+    """
+    parts = []
+    for i in range(max(1, word_count)):
+        parts.append(rng.choice(cjk_words))
+        if i < word_count - 1 and rng.random() < 0.2:
+            parts.append(rng.choice(cjk_punctuation[:2] + cjk_punctuation[6:]))
+    return "".join(parts) + "。"
+
+
+def make_transcript(segments=200, words_per_segment=20, cjk_ratio=0.0, missing_ratio=0.05, seed=0):
+    """
+    生成与对齐结果结构相同的转录词典
+
+    :param segments: 字幕条数
+    :param words_per_segment: 每条字幕的平均词数
+    :param cjk_ratio: 原文中中文词的比例
+    :param missing_ratio: 缺失时间戳的单词比例
+    :param seed: 随机种子
+    :return: 包含 segments 的词典，每条字幕有 text、translation、words、start、end
+    """
+    rng = random.Random(seed)
+    result = []
+    current = 0.0
+    for _ in range(segments):
+        word_count = max(1, int(rng.gauss(words_per_segment, words_per_segment / 4)))
+        text = " " + make_sentence(rng, word_count, cjk_ratio)
+        words = []
+        start = current
+        for token in text.split():
+            duration = rng.uniform(0.15, 0.6)
+            word = {"word": token}
+            if rng.random() >= missing_ratio:
+                word["start"] = round(current, 3)
+                word["end"] = round(current + duration, 3)
+                word["score"] = round(rng.random(), 3)
+            words.append(word)
+            current += duration + rng.uniform(0, 0.3)
+        result.append(
+            {
+                "start": round(start, 3),
+                "end": round(current, 3),
+                "text": text,
+                "translation": make_translation(rng, word_count),
+                "words": words,
+            }
+        )
+        current += rng.uniform(0.2, 1.5)
+    return {"segments": result}
+
+
+def make_llm_pieces(rng, text, word_limit):
+    """
+    模拟 LLM 的分割结果：按词数切分，并随机改动少量字符
+    """
+    words = text.split(" ")
+    pieces = []
+    for i in range(0, len(words), word_limit):
+        pieces.append(" ".join(words[i : i + word_limit]) + " ")
+    pieces[-1] = pieces[-1].rstrip(" ")
+    noisy = []
+    for piece in pieces:
+        chars = list(piece)
+        if chars and rng.random() < 0.3:
+            chars[rng.randrange(len(chars))] = rng.choice("abcxyz")
+        noisy.append("".join(chars))
+    return noisy
+
+
+def add_segmentation(transcript, word_limit=12, seed=0):
+    """
+    为转录词典添加分割结果（segments、translation_segments），
+    供 sub_optimize 和字幕生成使用；每段的词数在 word_limit 的一半到 word_limit 之间随机选取
+    """
+    rng = random.Random(seed)
+    for segment in transcript["segments"]:
+        words = segment["text"].strip().split(" ")
+        pieces = []
+        i = 0
+        while i < len(words):
+            step = rng.randint(max(1, word_limit // 2), word_limit)
+            pieces.append(" ".join(words[i : i + step]))
+            i += step
+        segment["segments"] = pieces
+        translation = segment["translation"]
+        step = max(1, len(translation) // len(pieces))
+        segment["translation_segments"] = [
+            translation[i * step : (i + 1) * step if i < len(pieces) - 1 else len(translation)]
+            for i in range(len(pieces))
+        ]
+    return transcript
@@ -7,10 +7,84 @@ device = "cuda"
 compute_type = "float16"
 transcibe_lang = "en"
 src_lang = "en-US"
+# 目标语言，也可以是列表，例如 ["zh-CN", "ja-JP", "es-ES"]：转录、对齐和原文分割只做一次，
+# 每种语言只增加翻译和译文分割，字幕文件名带语言后缀（如 xxx.ja-JP.srt）
 dst_lang = "zh-CN"
 whisper_model_type = "medium"
 whisper_model_dir = "models/whisper"
 align_model_dir = "models/align"
+# 对齐模型名称（torchaudio 或 Hugging Face 模型），设为 None 时使用 whisperX 为 transcibe_lang 选择的默认模型
+align_model_name = None
+# 分窗口流式转录：每个窗口的间隔和重叠时长（秒），设为 None（默认）时一次读入整个文件；
+# 很长的音视频内存不足时可以设为例如 600
+transcribe_window = None
+transcribe_overlap = 30
+# 转录缓存目录，按媒体内容指纹和模型参数查找，可以设为多个工作目录共享的路径；设为 None 时按输出路径判断是否已转录
+asr_cache_dir = "cache/asr"
+# 对齐结果的格式："json"，或 "columnar"：单词保存为列式数组，对齐结果保存为可以内存映射的二进制 .tsc 文件
+transcript_format = "json"
+# 多进程转录（适用于只有 CPU 的机器）：进程数大于 1 时启用，每个进程加载一份模型并使用 transcribe_threads 个线程
+transcribe_processes = 1
+transcribe_threads = 4
+
+# LLM 请求并发，根据延迟、错误率和限流在最小值与最大值之间自适应调整
+llm_concurrency_initial = 8
+llm_concurrency_min = 1
+llm_concurrency_max = 64
+
+# LLM 请求路由：按任务类型和输入长度把请求发往不同的模型和端点，首选路由失败时依次尝试后面的路由。
+# llm_routes 中省略的 model、base_url、api_key 使用上面的 llm_model、base_url、api_key，max_retries 为该路由的尝试次数；
+# 路由名称 "default" 表示 llm_model。任务类型：translate（单条翻译）、translate_batch（批量翻译）、
+# split（单条原文分割）、split_batch（批量原文分割）、split_duo（把超长的片段一分为二）。
+# llm_route_rules 按顺序使用第一条匹配的规则，max_tokens 为需要处理的文本的 token 数上限，都不匹配时使用 default；
+# 为空时不路由。链中不是最后一个的路由默认只尝试 llm_route_fallback_retries 次，失败后尽快换用后面的路由
+llm_routes = {
+    # "fast": {"model": "gpt-4.1-mini", "base_url": "https://api.openai.com/v1", "api_key": "sk-..."},
+}
+llm_route_rules = [
+    # {"tasks": ["split", "split_duo", "translate"], "max_tokens": 100, "routes": ["fast", "default"]},
+    # {"tasks": ["split_batch"], "routes": ["fast", "default"]},
+]
+llm_route_fallback_retries = 2
+
+# 生成的字幕格式，可选 srt、ass、vtt
+subtitle_formats = ["srt", "ass"]
+
+# 翻译按 token 预算（输入与预计输出之和）动态打包批次，设为 None 时按固定条数分批
+translate_token_budget = 3000
+translate_max_batch_size = 50
+# 补充或覆盖模型的上下文长度和最大输出长度，例如 {"my-model": {"context": 32768, "output": 4096}}
+model_token_limits = {}
+# 翻译模式："batch" 每个批次独立请求；"window" 每 translate_window_batches 个连续批次在同一段多轮对话中翻译，
+# 请求前缀逐字节不变，可以命中服务商的前缀缓存（DeepSeek、OpenAI 等自动启用）；
+# 窗口中的对话历史与本轮请求之和超过 translate_token_budget 时丢弃最早的轮次，预算较小时窗口模式的收益有限
+translate_mode = "batch"
+translate_window_batches = 8
+# 多种目标语言时是否在一次请求中同时翻译所有语言，失败的部分再逐个语言补齐
+translate_combine_targets = True
+# 原文分割时每次请求合并的字幕条数，为 1 时逐条请求
+segment_batch_size = 10
+# 本地分割（按停顿和标点）断点得分的最低要求，取值 0 到 1，越高越保守，更多字幕交给 API 分割；设为 None 时不在本地分割
+segment_local_threshold = 0.8
+# 重复行合并：同一次运行中相同的行（区分大小写，忽略多余空白）只翻译一次，原文完全相同的行只分割一次。
+# 相同的原文在不同位置可能需要不同的译文，默认关闭；讲座、直播等重复较多的内容可以开启。
+# coalesce_ambiguous 中的行有歧义，只与前后 coalesce_context 行也相同的行合并
+coalesce_lines = False
+coalesce_ambiguous = [
+    "Right.", "Right?", "Okay?", "Yes.", "No.", "Sure.", "Really?", "What?",
+    "Well.", "So.", "That's it.", "That's right.", "Exactly.", "Go ahead.",
+]
+coalesce_context = 1
+
+# 流水线：翻译、分割阶段的并行文件数，以及阶段之间队列的长度
+translate_workers = 2
+segment_workers = 2
+stage_queue_size = 1
+
+# 翻译缓存，设为空字符串时禁用
+translate_cache_path = "cache/translate.sqlite3"
+translate_cache_max_entries = 200000
+translate_cache_max_age = 90 * 24 * 3600  # 秒
 
 # 定义样式
 original_style = pysubs2.SSAStyle(
@@ -36,3 +110,25 @@ translated_style = pysubs2.SSAStyle(
     alignment=2,
     marginv=5,
 )
+
+# 指标文件：流水线各阶段耗时和队列长度、API 请求耗时、重试、失败、token 用量以及降级次数，
+# 每 metrics_interval 秒写入一次；扩展名为 .json 时写 JSON 快照（含最近文件的各阶段耗时），
+# 否则写 Prometheus 文本格式，可由 node_exporter 的 textfile collector 采集；设为 None 关闭
+metrics_path = "output/metrics.prom"
+metrics_interval = 15
+
+# 性能分析：设置目录后，每个文件的每个流水线阶段写入 cProfile 结果（.prof，可用 snakeviz 查看）、
+# 所有线程的采样调用栈（.folded，可用 flamegraph.pl 或 speedscope 查看）、各小节的耗时与内存峰值（.txt、.json）；
+# 也可以用 main.py / daemon.py 的 --profile 参数开启。profile_memory 开启 tracemalloc 记录内存峰值，会明显变慢。
+# 同时处理多个文件时采样和内存峰值会相互混合，分析时建议把各阶段的工作线程数设为 1
+profile_dir = None
+profile_memory = True
+
+# 守护进程（daemon.py）：监视的文件夹、扫描间隔（秒）、文件最后修改后等待的秒数（避免处理未复制完的文件）、
+# 同时处理的文件数、任务队列数据库和每个任务最多尝试的次数
+watch_dirs = []
+watch_interval = 30
+watch_settle = 60
+daemon_concurrency = 4
+job_queue_path = "cache/jobs.sqlite3"
+job_max_attempts = 3
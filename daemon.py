@@ -0,0 +1,164 @@
+"""
+无界面的监视文件夹守护进程
+
+定期扫描 watch_dirs 中的音视频文件，新文件或内容变化的文件加入持久化任务队列，
+同时处理的文件数不超过 daemon_concurrency。
+
+    python daemon.py            # 持续运行，Ctrl+C 或 SIGTERM 后等待运行中的任务完成再退出
+    python daemon.py --once     # 处理完当前所有文件后退出
+    python daemon.py --status   # 查看任务状态
+    python daemon.py --profile output/profile   # 记录每个文件各阶段的性能分析结果
+"""
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+
+from base.files_find import Files
+from base.job_queue import JobQueue
+from config import *
+
+# 获取 httpx 的日志记录器
+httpx_logger = logging.getLogger("httpx")
+# 将 httpx 的日志级别设置为 WARNING，这样 INFO 级别的日志就不会输出
+httpx_logger.setLevel(logging.WARNING)
+api_request_logger = logging.getLogger("api_request")
+api_request_logger.setLevel(logging.WARNING)
+# 与流水线共用日志记录器，导入 pipline 时配置
+logger = logging.getLogger("pipline")
+
+
+def scan(queue, extensions):
+    """
+    扫描监视的文件夹，把新文件和内容变化的文件加入队列
+    每个监视文件夹的输出放在以其名称命名的子文件夹中
+    :return: 加入队列的文件数
+    """
+    now = time.time()
+    added = 0
+    for watch_dir in watch_dirs:
+        # 去掉末尾的 "/"，否则 Files 截取相对路径时会多截掉一个字符
+        watch_dir = os.path.normpath(watch_dir)
+        prefix = os.path.basename(watch_dir)
+        input_paths, output_paths = Files(watch_dir, prefix, extensions=extensions, mkdir=False)
+        for input_path, output_path in zip(input_paths, output_paths):
+            try:
+                stat = os.stat(input_path)
+            except OSError:
+                continue
+            # 最近仍在修改的文件可能还没有复制完
+            if now - stat.st_mtime < watch_settle:
+                continue
+            signature = f"{stat.st_size}:{stat.st_mtime_ns}"
+            if queue.enqueue(os.path.abspath(input_path), os.path.splitext(output_path)[0], signature):
+                logger.info(f"文件 {input_path} 加入队列")
+                added += 1
+    return added
+
+
+def serve(once=False):
+    # 导入流水线会加载配置和模型库，只在真正处理时导入
+    from pipline import start_stages, flush_metrics, close_transcribe_pool, media_extensions
+
+    queue = JobQueue(job_queue_path, max_attempts=job_max_attempts)
+    requeued = queue.requeue_running()
+    if requeued:
+        logger.info(f"{requeued} 个上次中断的任务重新排队")
+
+    transcribe_stage = start_stages()
+    running = set()
+    running_lock = threading.Lock()
+    # 任务完成时唤醒主循环，立即补充新任务
+    wake = threading.Event()
+    stop = threading.Event()
+
+    def on_signal(signum, frame):
+        logger.info("收到退出信号，等待运行中的任务完成")
+        stop.set()
+        wake.set()
+        # 再次收到信号时立即退出
+        signal.signal(signum, signal.SIG_DFL)
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+    def make_status(job_id, input_path):
+        def status(stage, error=None):
+            if stage == "done":
+                queue.finish(job_id)
+                logger.info(f"任务 {job_id} 完成：{input_path}")
+            elif stage == "failed":
+                queue.fail(job_id, error)
+                logger.error(f"任务 {job_id} 失败：{input_path}：{error}")
+            else:
+                queue.set_stage(job_id, stage)
+                return
+            with running_lock:
+                running.discard(job_id)
+            wake.set()
+
+        return status
+
+    while not stop.is_set():
+        scan(queue, media_extensions)
+        with running_lock:
+            free = daemon_concurrency - len(running)
+        for job_id, input_path, output_path in queue.claim(free):
+            with running_lock:
+                running.add(job_id)
+            # 阶段队列已满时在此等待
+            transcribe_stage.put(
+                {
+                    "input_path": input_path,
+                    "output_path": output_path,
+                    "status": make_status(job_id, input_path),
+                }
+            )
+        with running_lock:
+            idle = not running
+        if once and idle and not queue.counts().get("queued"):
+            break
+        wake.wait(watch_interval)
+        wake.clear()
+
+    transcribe_stage.close()
+    close_transcribe_pool()
+    flush_metrics()
+    logger.info(f"任务状态：{queue.counts()}")
+    queue.close()
+
+
+def print_status(limit):
+    queue = JobQueue(job_queue_path, max_attempts=job_max_attempts)
+    counts = queue.counts()
+    print("  ".join(f"{status}: {count}" for status, count in sorted(counts.items())) or "队列为空")
+    for job in queue.jobs(limit=limit):
+        updated = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job["updated"]))
+        line = f"{job['id']:>6}  {job['status']:<8} {job['stage'] or '':<10} {job['attempts']}  {updated}  {job['input_path']}"
+        if job["error"]:
+            line += f"\n        {job['error']}"
+        print(line)
+    queue.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="监视文件夹并处理新的音视频文件")
+    parser.add_argument("--once", action="store_true", help="处理完当前所有文件后退出")
+    parser.add_argument("--status", action="store_true", help="显示任务状态后退出")
+    parser.add_argument("--limit", type=int, default=50, help="显示的任务数")
+    parser.add_argument("--profile", metavar="DIR", help="开启性能分析，结果写入此目录")
+    args = parser.parse_args(argv)
+    if args.status:
+        print_status(args.limit)
+    else:
+        if args.profile:
+            from pipline import enable_profiling
+
+            enable_profiling(args.profile, memory=profile_memory)
+        serve(once=args.once)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
+import argparse
 import logging
-from pipline import run
+from pipline import run, enable_profiling, profile_memory
 # 获取 httpx 的日志记录器
 httpx_logger = logging.getLogger('httpx')
 # 将 httpx 的日志级别设置为 WARNING，这样 INFO 级别的日志就不会输出
 httpx_logger.setLevel(logging.WARNING)
 api_request_logger=logging.getLogger('api_request')
 api_request_logger.setLevel(logging.WARNING)
+parser = argparse.ArgumentParser(description="转录、翻译并生成双语字幕")
+parser.add_argument("--profile", metavar="DIR", help="开启性能分析，每个文件各阶段的结果写入此目录")
+args = parser.parse_args()
+if args.profile:
+    enable_profiling(args.profile, memory=profile_memory)
 run()
\ No newline at end of file
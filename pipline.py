@@ -1,17 +1,28 @@
-from base.media_transcribe import transcribe_batch
-from base.sub_translate import sub_translate
-from base.sub_segment import sub_segment
+from base.media_transcribe import transcribe_batch, transcribe_stream
+from base.sub_translate import sub_translate_targets, translation_field
+from base.sub_segment import sub_segment, split_translated
 from base.sub_optimize import sub_optimize
-from base.path_request import Directory
 from base.files_find import Files
-from base.srt_generate import generate_bilingual_srt
-from base.srt2ass import convert_srt_to_ass
+from base.sub_emit import emit_subtitles
+from base.translate_cache import TranslateCache
+from base.api_engine import get_engine
+from base.api_router import Router, set_router
+from base.api_control import AdaptiveLimiter
+from base.api_scheduler import Job
+from base.pipeline_stage import Stage
+from base.checkpoint import Journal
+from base.asr_cache import ASRCache, asr_cache_key, media_fingerprint
+from base.transcribe_pool import TranscribePool
+from base.transcript_store import ColumnarTranscript, to_plain
+from base.token_budget import model_limits
+from base.metrics import Exporter
+from base.profiling import StageProfile, section
+from base.sub_coalesce import Coalescer
 import whisperX.whisperx as wsx
 from config import *
 
 import os
 import json
-import threading
 import logging
 import colorlog  # 引入 colorlog 模块
 
@@ -56,150 +67,610 @@ def setup_logger():
 
 logger = setup_logger()
 
+# 处理的音视频文件扩展名
+media_extensions = [".webm", ".mkv", ".flv", ".mp4", ".mp3", ".flac", ".ogg", ".wav"]
 
 
 
-# 使用锁来确保只有一个 process_transcript 在运行
-process_lock = threading.Lock()
 
-
-def process_transcript(aligned_transcript, input_path, output_path):
-    with process_lock:
-        logging.info(f"文件 {input_path} 字幕翻译开始")
-        sub_translate(
+def translate_transcript(task):
+    """
+    流水线的翻译阶段
+    :param task: 任务词典，包含 aligned_transcript、input_path、output_path、dst_langs、job、translate_cache、journal、status
+    :return: 交给分割阶段的任务
+    """
+    aligned_transcript = task["aligned_transcript"]
+    input_path = task["input_path"]
+    output_path = task["output_path"]
+    report(task, "translate")
+    # 回放上次中断前已完成的翻译和分割
+    with section("journal_replay"):
+        # 只回放同一模型、同一目标语言的结果，修改配置后旧的结果不会写入新的输出
+        fields = {translation_field(dst_lang, task["dst_langs"]): dst_lang for dst_lang in task["dst_langs"]}
+        replayed = task["journal"].replay(aligned_transcript, model=llm_model, fields=fields)
+    if replayed:
+        logging.info(f"文件 {input_path} 从检查点恢复 {replayed} 条结果")
+    logging.info(f"文件 {input_path} 字幕翻译开始")
+    with section("sub_translate"):
+        sub_translate_targets(
             aligned_transcript,
             api_key=api_key,
             base_url=base_url,
             model=llm_model,
             src_lang=src_lang,
-            dst_lang=dst_lang,
+            dst_langs=task["dst_langs"],
             media_title=os.path.basename(input_path),
+            combine=translate_combine_targets,
             context_window=10,
             batch_size=10,
-            thread_count=10,
+            thread_count=llm_concurrency_max,
+            token_budget=translate_token_budget,
+            max_batch_size=translate_max_batch_size,
+            mode=translate_mode,
+            window_batches=translate_window_batches,
+            cache=task["translate_cache"],
+            job=task["job"],
+            journal=task["journal"],
+            coalescer=resources.get("coalescer"),
         )
-        logging.info(f"文件 {input_path} 字幕翻译结束")
-        with open(
-            os.path.join("output/translated_transcripts", output_path) + ".json",
-            "w",
-            encoding="utf-8",
-        ) as f:
-            json.dump(aligned_transcript, f, ensure_ascii=False)
-
-        logging.info(f"文件 {input_path} 字幕分割开始")
+    logging.info(f"文件 {input_path} 字幕翻译结束，{task['job'].usage.summary()}")
+    with section("dump"), open(
+        os.path.join("output/translated_transcripts", output_path) + ".json",
+        "w",
+        encoding="utf-8",
+    ) as f:
+        json.dump(to_plain(aligned_transcript), f, ensure_ascii=False)
+    return task
+
+
+def segment_transcript(task):
+    """
+    流水线的分割阶段：分割、优化并生成字幕文件
+    :param task: 任务词典
+    """
+    aligned_transcript = task["aligned_transcript"]
+    input_path = task["input_path"]
+    output_path = task["output_path"]
+    report(task, "segment")
+    logging.info(f"文件 {input_path} 字幕分割开始")
+    with section("sub_segment"):
         sub_segment(
             aligned_transcript,
             api_key=api_key,
             base_url=base_url,
             model=llm_model,
             word_limit=12,
-            thread_count=20,
-        )
-        logging.info(f"文件 {input_path} 字幕分割结束")
-
-        sub_optimize(aligned_transcript, src_lang=src_lang, dst_lang=dst_lang)
-        logging.info(f"文件 {input_path} 字幕翻译优化")
-
-        with open(
-            os.path.join("output/segmented_transcripts", output_path) + ".json",
-            "w",
-            encoding="utf-8",
-        ) as f:
-            json.dump(aligned_transcript, f, ensure_ascii=False)
-        srt_path = os.path.join("output/srt", output_path) + ".srt"
-        generate_bilingual_srt(aligned_transcript, srt_path)
-        logging.info(f"文件 {input_path} 生成 srt 字幕")
-        convert_srt_to_ass(
-            srt_path,
-            os.path.join("output/ass", output_path) + ".ass",
-            original_style=original_style,
-            translated_style=translated_style,
+            thread_count=llm_concurrency_max,
+            job=task["job"],
+            journal=task["journal"],
+            batch_size=segment_batch_size,
+            local_threshold=segment_local_threshold,
+            coalescer=resources.get("coalescer"),
         )
-        logging.info(f"文件 {input_path} 生成 ass 字幕")
+    logging.info(f"文件 {input_path} 字幕分割结束")
 
+    # 第一种目标语言直接使用转录结果，其余语言共用原文的分割，只分割各自的译文
+    dst_langs = task["dst_langs"]
+    with section("split_translated"):
+        views = [(dst_langs[0], aligned_transcript)] + [
+            (lang, language_view(aligned_transcript, translation_field(lang, dst_langs))) for lang in dst_langs[1:]
+        ]
+    with section("sub_optimize"):
+        for lang, view in views:
+            sub_optimize(view, src_lang=src_lang, dst_lang=lang)
+    logging.info(f"文件 {input_path} 字幕翻译优化")
 
-def run():
-    src_dir = Directory("选择视频文件所在文件夹")
-    input_paths, output_paths = Files(
-        src_dir,
-        "",
-        extensions=[".webm", ".mkv", ".flv", ".mp4", ".mp3", ".flac", ".ogg", ".wav"],
-        mkdir=False,
-    )
-    file_count = len(input_paths)
+    with section("dump"), open(
+        os.path.join("output/segmented_transcripts", output_path) + ".json",
+        "w",
+        encoding="utf-8",
+    ) as f:
+        json.dump(to_plain(aligned_transcript), f, ensure_ascii=False)
+    # 分割结果已经完整写入，不再需要检查点
+    task["journal"].remove()
+    # 遍历一次转录结果，同时生成所有需要的字幕格式；多种目标语言时文件名带语言后缀
+    with section("emit_subtitles"):
+        for lang, view in views:
+            suffix = lang if len(dst_langs) > 1 else None
+            emit_subtitles(
+                view,
+                srt_path=subtitle_path("srt", output_path, suffix),
+                ass_path=subtitle_path("ass", output_path, suffix),
+                vtt_path=subtitle_path("vtt", output_path, suffix),
+                original_style=original_style,
+                translated_style=translated_style,
+            )
+    logging.info(f"文件 {input_path} 生成 {'、'.join(subtitle_formats)} 字幕")
+    logging.info(f"文件 {input_path} 的 LLM 用量：{task['job'].usage.summary()}")
+    report(task, "done")
 
-    # 创建输出需要的文件夹
-    for output_path in output_paths:
-        output_dir = os.path.dirname(os.path.join("output/transcripts", output_path))
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        output_dir = os.path.dirname(
-            os.path.join("output/aligned_transcripts", output_path)
+
+def subtitle_path(format, output_path, lang=None):
+    """
+    字幕文件的输出路径，未启用该格式时返回 None
+    :param lang: 目标语言后缀，为 None 时不加
+    """
+    if format not in subtitle_formats:
+        return None
+    path = os.path.join("output", format, output_path)
+    if lang:
+        path += "." + lang
+    return path + "." + format
+
+
+def target_languages():
+    """
+    配置中的目标语言列表，dst_lang 可以是一种语言或语言列表
+    """
+    return [dst_lang] if isinstance(dst_lang, str) else list(dst_lang)
+
+
+def language_view(aligned_transcript, field):
+    """
+    一种目标语言的字幕词典：原文和原文的分割与转录结果共用，译文取自 field 并按原文分割的段数分割
+    原文分割会被复制，sub_optimize 在每种语言的结果上分别执行
+    """
+    segments = []
+    for segment in aligned_transcript["segments"]:
+        view = {key: segment[key] for key in segment.keys()}
+        view["segments"] = list(segment["segments"])
+        view["translation"] = segment.get(field, "")
+        view["translation_segments"] = split_translated(view["translation"], len(view["segments"]))
+        segments.append(view)
+    return {"segments": segments}
+
+
+def make_task(aligned_transcript, input_path, output_path, translate_cache=None, status=None, dst_langs=None):
+    """
+    创建流水线任务
+    :param status: 状态回调 status(stage, error)，见 report
+    :param dst_langs: 目标语言列表，为 None 时使用配置中的 dst_lang
+    """
+    dst_langs = dst_langs or target_languages()
+    if transcript_format == "columnar" and not isinstance(aligned_transcript, ColumnarTranscript):
+        # 等待翻译和分割期间以列式保存，减少内存占用
+        aligned_transcript = ColumnarTranscript.from_dict(aligned_transcript)
+    return {
+        "aligned_transcript": aligned_transcript,
+        "input_path": input_path,
+        "output_path": output_path,
+        "dst_langs": dst_langs,
+        # 每条字幕需要每种语言翻译一次和分割一次，剩余工作量越少的文件请求越优先
+        "job": Job(input_path, remaining=(len(dst_langs) + 1) * len(aligned_transcript["segments"])),
+        "translate_cache": translate_cache,
+        "journal": Journal(os.path.join("output/journal", output_path) + ".jsonl"),
+        "status": status,
+    }
+
+
+def process_transcript(aligned_transcript, input_path, output_path, translate_cache=None, dst_langs=None):
+    """
+    依次执行翻译和分割阶段，处理一个转录结果
+    """
+    task = make_task(aligned_transcript, input_path, output_path, translate_cache, dst_langs=dst_langs)
+    profiled("segment", segment_transcript)(profiled("translate", translate_transcript)(task))
+
+
+# Whisper 和对齐模型，第一次需要转录时才加载，全部命中缓存时不加载
+models = {}
+
+
+def get_models():
+    if not models:
+        models["whisper_model"] = wsx.load_model(
+            whisper_model_type,
+            device,
+            compute_type=compute_type,
+            download_root=whisper_model_dir,
         )
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        output_dir = os.path.dirname(
-            os.path.join("output/translated_transcripts", output_path)
+        models["align_model"], models["metadata"] = wsx.load_align_model(
+            language_code=transcibe_lang, device=device, model_name=align_model_name, model_dir=align_model_dir
         )
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        output_dir = os.path.dirname(
-            os.path.join("output/segmented_transcripts", output_path)
+    return models
+
+
+def transcribe_file(input_path):
+    """
+    转录并对齐一个文件
+    :return: (transcript, aligned_transcript)
+    """
+    logging.info(f"文件 {input_path} Whisper 转录开始")
+    # 第一次转录时加载模型
+    with section("load_models"):
+        loaded = get_models()
+    if transcribe_window:
+        # 分窗口解码和转录，长音视频也不会整个读入内存
+        transcript, aligned_transcript = transcribe_stream(
+            input_path,
+            device=device,
+            batch_size=10,
+            language=transcibe_lang,
+            window=transcribe_window,
+            overlap=transcribe_overlap,
+            columnar=transcript_format == "columnar",
+            **loaded,
         )
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        output_dir = os.path.dirname(os.path.join("output/srt", output_path))
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        output_dir = os.path.dirname(os.path.join("output/ass", output_path))
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+    else:
+        transcript, aligned_transcript = transcribe_batch(
+            input_path,
+            device=device,
+            batch_size=10,
+            language=transcibe_lang,
+            columnar=transcript_format == "columnar",
+            **loaded,
+        )
+    logging.info(f"文件 {input_path} Whisper 转录结束")
+    return transcript, aligned_transcript
 
-    # 去除路径的扩展名
-    for i in range(file_count):
-        output_paths[i], _ = os.path.splitext(output_paths[i])
 
-    whisper_model = wsx.load_model(
-        whisper_model_type,
-        device,
+def asr_key(input_path):
+    """
+    转录缓存键：媒体内容指纹加上影响转录结果的全部参数
+    对齐模型按名称区分，名称为 None 时由语言决定，与模型的存放目录无关，不同工作目录可以共享缓存
+    """
+    return asr_cache_key(
+        media_fingerprint(input_path),
+        whisper_model_type=whisper_model_type,
         compute_type=compute_type,
-        download_root=whisper_model_dir,
-    )
-    align_model, metadata = wsx.load_align_model(
-        language_code=transcibe_lang, device=device, model_dir=align_model_dir
+        language=transcibe_lang,
+        align_model=align_model_name,
+        window=transcribe_window,
+        overlap=transcribe_overlap if transcribe_window else None,
     )
 
-    for i in range(file_count):
-        transcript_path = os.path.join("output/transcripts", output_paths[i]) + ".json"
-        aligned_transcript_path = (
-            os.path.join("output/aligned_transcripts", output_paths[i]) + ".json"
-        )
 
-        # 检查转录文件是否已经存在
-        if os.path.exists(transcript_path) and os.path.exists(aligned_transcript_path):
-            logging.info(f"文件 {input_paths[i]} 的转录结果已存在，直接读取")
-            with open(transcript_path, "r", encoding="utf-8") as f:
-                transcript = json.load(f)
+def key_path(output_path):
+    """
+    输出的转录结果对应的转录缓存键，记录在 output/transcripts 中转录结果的旁边
+    """
+    return os.path.join("output/transcripts", output_path) + ".key"
+
+
+def cached_transcript(input_path, output_path, asr_cache=None, key=None):
+    """
+    查找已有的转录结果：启用转录缓存时先按内容指纹查找，未命中时再查找输出路径下的转录结果，
+    只有其旁边记录的缓存键与当前的相同（同一份媒体、相同的模型参数）时才使用并写入缓存，
+    同名文件被替换后不会误用旧结果；没有启用转录缓存时只按输出路径查找
+
+    :param key: 转录缓存键，由调用方用 asr_key 计算一次，与 save_transcript 共用
+    :return: (transcript, aligned_transcript)，没有时返回 None
+    """
+    transcript_path = os.path.join("output/transcripts", output_path) + ".json"
+    aligned_transcript_path = aligned_path(output_path)
+    if asr_cache is not None:
+        cached = asr_cache.get(key)
+        if cached is not None:
+            logging.info(f"文件 {input_path} 命中转录缓存")
+            save_transcript(input_path, output_path, *cached, key=key)
+            return cached
+        try:
+            with open(key_path(output_path), "r", encoding="utf-8") as f:
+                if f.read().strip() != key:
+                    return None
+        except OSError:
+            return None
+    # 检查转录文件是否已经存在
+    if os.path.exists(transcript_path) and os.path.exists(aligned_transcript_path):
+        logging.info(f"文件 {input_path} 的转录结果已存在，直接读取")
+        with open(transcript_path, "r", encoding="utf-8") as f:
+            transcript = json.load(f)
+        if transcript_format == "columnar":
+            aligned_transcript = ColumnarTranscript.load(aligned_transcript_path)
+        else:
             with open(aligned_transcript_path, "r", encoding="utf-8") as f:
                 aligned_transcript = json.load(f)
-        else:
-            logging.info(f"文件 {input_paths[i]} Whisper 转录开始")
-            transcript, aligned_transcript = transcribe_batch(
-                input_paths[i],
-                device=device,
-                whisper_model=whisper_model,
-                align_model=align_model,
-                metadata=metadata,
-                batch_size=10,
-                language=transcibe_lang,
+        if asr_cache is not None:
+            asr_cache.put(key, transcript, to_plain(aligned_transcript))
+        return transcript, aligned_transcript
+    return None
+
+
+def aligned_path(output_path):
+    """
+    对齐结果的保存路径，列式格式保存为可以内存映射的 .tsc 文件
+    """
+    extension = ".tsc" if transcript_format == "columnar" else ".json"
+    return os.path.join("output/aligned_transcripts", output_path) + extension
+
+
+def save_transcript(input_path, output_path, transcript, aligned_transcript, asr_cache=None, key=None):
+    """
+    将转录结果写入 output/transcripts 和 output/aligned_transcripts，启用转录缓存时同时写入缓存
+
+    :param key: 转录缓存键，与 cached_transcript 使用的相同；不为 None 时记录在转录结果旁边
+    """
+    if asr_cache is not None:
+        asr_cache.put(key, transcript, to_plain(aligned_transcript))
+    with open(os.path.join("output/transcripts", output_path) + ".json", "w", encoding="utf-8") as f:
+        json.dump(transcript, f, ensure_ascii=False)
+    if transcript_format == "columnar":
+        if not isinstance(aligned_transcript, ColumnarTranscript):
+            aligned_transcript = ColumnarTranscript.from_dict(aligned_transcript)
+        aligned_transcript.save(aligned_path(output_path))
+    else:
+        with open(aligned_path(output_path), "w", encoding="utf-8") as f:
+            json.dump(to_plain(aligned_transcript), f, ensure_ascii=False)
+    # 最后写入缓存键，中途失败时不会留下与缓存键不符的转录结果；没有缓存键时删除旧的，它已经与转录结果不符
+    if key is not None:
+        with open(key_path(output_path), "w", encoding="utf-8") as f:
+            f.write(key)
+    elif os.path.exists(key_path(output_path)):
+        os.remove(key_path(output_path))
+
+
+def make_transcribe_pool():
+    """
+    创建多进程转录池，每个进程固定使用 transcribe_threads 个 CPU 线程
+    """
+    return TranscribePool(
+        processes=transcribe_processes,
+        threads=transcribe_threads,
+        model_options={
+            "device": device,
+            "whisper_model_type": whisper_model_type,
+            "compute_type": compute_type,
+            "whisper_model_dir": whisper_model_dir,
+            "language": transcibe_lang,
+            "align_model_name": align_model_name,
+            "align_model_dir": align_model_dir,
+        },
+        transcribe_options={
+            "batch_size": 10,
+            "language": transcibe_lang,
+            "window": transcribe_window,
+            "overlap": transcribe_overlap,
+            "columnar": transcript_format == "columnar",
+        },
+    )
+
+
+def report(task, stage, error=None):
+    """
+    报告任务所处的阶段，任务带有 status 回调时调用
+    :param stage: "transcribe"、"translate"、"segment"、"done" 或 "failed"
+    :param error: 失败时的异常
+    """
+    status = task.get("status")
+    if status is not None:
+        status(stage, error)
+
+
+def stage_failed(task, error):
+    report(task, "failed", error)
+
+
+def prepare_output_dirs(output_path):
+    """
+    创建输出需要的文件夹
+    """
+    folders = [
+        "output/transcripts",
+        "output/aligned_transcripts",
+        "output/translated_transcripts",
+        "output/segmented_transcripts",
+    ] + [os.path.join("output", format) for format in subtitle_formats]
+    for folder in folders:
+        output_dir = os.path.dirname(os.path.join(folder, output_path))
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+
+
+# 进程内共享的资源，由 setup 创建一次
+resources = {}
+
+
+def setup():
+    """
+    初始化请求引擎和路由、模型 token 限制、翻译缓存、重复行合并、转录缓存、转录进程池和指标导出，多次调用只初始化一次
+    """
+    if resources:
+        if resources["transcribe_pool"] is None and transcribe_processes > 1:
+            # 上一批文件处理完后进程池已经关闭
+            resources["transcribe_pool"] = make_transcribe_pool()
+        return resources
+
+    # 共享请求引擎，并发上限在 llm_concurrency_min 到 llm_concurrency_max 之间自适应调整
+    get_engine(
+        api_key,
+        base_url,
+        limiter=AdaptiveLimiter(
+            initial=llm_concurrency_initial,
+            minimum=llm_concurrency_min,
+            maximum=llm_concurrency_max,
+        ),
+    )
+
+    # 按任务类型和输入长度路由请求，每个路由的端点使用自己的请求引擎和并发控制
+    if llm_route_rules:
+        for route in llm_routes.values():
+            get_engine(
+                route.get("api_key", api_key),
+                route.get("base_url", base_url),
+                limiter=AdaptiveLimiter(
+                    initial=llm_concurrency_initial,
+                    minimum=llm_concurrency_min,
+                    maximum=llm_concurrency_max,
+                ),
             )
-            logging.info(f"文件 {input_paths[i]} Whisper 转录结束")
-            with open(transcript_path, "w", encoding="utf-8") as f:
-                json.dump(transcript, f, ensure_ascii=False)
-            with open(aligned_transcript_path, "w", encoding="utf-8") as f:
-                json.dump(aligned_transcript, f, ensure_ascii=False)
-        # 启动一个新线程来处理转录后的任务
-        threading.Thread(
-            target=process_transcript,
-            args=(aligned_transcript, input_paths[i], output_paths[i]),
-        ).start()
+        set_router(Router(llm_routes, llm_route_rules, fallback_retries=llm_route_fallback_retries))
+
+    # 配置中补充或覆盖的模型 token 限制
+    model_limits.update(model_token_limits)
+
+    # 翻译缓存，跨运行复用已完成的翻译
+    translate_cache = None
+    if translate_cache_path:
+        translate_cache = TranslateCache(
+            translate_cache_path,
+            max_entries=translate_cache_max_entries,
+            max_age=translate_cache_max_age,
+        )
+    resources["translate_cache"] = translate_cache
+    # 同一次运行的所有文件共享，重复的行只翻译和分割一次
+    resources["coalescer"] = (
+        Coalescer(ambiguous=coalesce_ambiguous, context=coalesce_context) if coalesce_lines else None
+    )
+    # 按内容指纹缓存转录结果，可以在多个工作目录之间共享
+    resources["asr_cache"] = ASRCache(asr_cache_dir) if asr_cache_dir else None
+    resources["transcribe_pool"] = make_transcribe_pool() if transcribe_processes > 1 else None
+    # 定期把各阶段耗时、API 请求和 token 用量写入指标文件
+    resources["metrics"] = Exporter(metrics_path, metrics_interval).start() if metrics_path else None
+    return resources
+
+
+def close_transcribe_pool():
+    """
+    关闭转录进程池并等待工作进程退出；之后再调用 setup 时重新创建
+    """
+    pool = resources.get("transcribe_pool")
+    if pool is not None:
+        resources["transcribe_pool"] = None
+        pool.close()
+
+
+def flush_metrics():
+    """
+    立即写入指标文件
+    """
+    exporter = resources.get("metrics")
+    if exporter is not None:
+        exporter.flush()
+
+
+def transcribe_task(item):
+    """
+    流水线的转录阶段：读取已有的转录结果或转录，创建交给翻译阶段的任务
+    :param item: 包含 input_path、output_path 以及可选的 status 回调、目标语言列表 dst_langs 的词典
+    :return: 交给翻译阶段的任务
+    """
+    input_path = item["input_path"]
+    output_path = item["output_path"]
+    prepare_output_dirs(output_path)
+    report(item, "transcribe")
+    asr_cache = resources["asr_cache"]
+    pool = resources["transcribe_pool"]
+    with section("cache_lookup"):
+        # 缓存键需要读取媒体文件计算指纹，每个文件只计算一次
+        key = asr_key(input_path) if asr_cache is not None else None
+        found = cached_transcript(input_path, output_path, asr_cache, key)
+    if found is not None:
+        transcript, aligned_transcript = found
+    elif pool is not None:
+        logging.info(f"文件 {input_path} Whisper 转录开始（进程池）")
+        # 转录在工作进程中进行，这里只能记录等待时间
+        with section("transcribe_pool"):
+            transcript, aligned_transcript = pool.transcribe(input_path)
+        logging.info(f"文件 {input_path} Whisper 转录结束")
+        with section("save_transcript"):
+            save_transcript(input_path, output_path, transcript, aligned_transcript, asr_cache, key)
+    else:
+        transcript, aligned_transcript = transcribe_file(input_path)
+        with section("save_transcript"):
+            save_transcript(input_path, output_path, transcript, aligned_transcript, asr_cache, key)
+    return make_task(
+        aligned_transcript,
+        input_path,
+        output_path,
+        resources["translate_cache"],
+        status=item.get("status"),
+        dst_langs=item.get("dst_langs"),
+    )
+
+
+def profiled(stage, func):
+    """
+    开启性能分析（profile_dir 不为 None）时，每个文件的这一阶段记录 cProfile、采样调用栈、
+    各小节的耗时和内存峰值，写入 profile_dir 下与输出相同的相对路径
+    :param stage: 阶段名称
+    :param func: 阶段的处理函数，接收包含 output_path 的任务
+    """
+
+    def wrapper(item):
+        if not profile_dir:
+            return func(item)
+        profile = StageProfile(profile_dir, item["output_path"], stage, memory=profile_memory)
+        with profile.run():
+            return func(item)
+
+    return wrapper
+
+
+def enable_profiling(directory, memory=True):
+    """
+    开启性能分析，覆盖配置中的 profile_dir 和 profile_memory
+    """
+    global profile_dir, profile_memory
+    profile_dir = directory
+    profile_memory = memory
+
+
+def start_stages():
+    """
+    启动 转录 -> 翻译 -> 分割 三段流水线，阶段之间是有界队列
+    队列满时上游阻塞，内存中的转录结果数量不超过 各阶段队列长度与工作线程数之和
+    :return: 转录阶段，向它 put 任务；close 时等待所有阶段处理完毕
+    """
+    setup()
+    segment_stage = Stage(
+        "segment",
+        profiled("segment", segment_transcript),
+        workers=segment_workers,
+        queue_size=stage_queue_size,
+        on_error=stage_failed,
+    ).start()
+    translate_stage = Stage(
+        "translate",
+        profiled("translate", translate_transcript),
+        workers=translate_workers,
+        queue_size=stage_queue_size,
+        next_stage=segment_stage,
+        on_error=stage_failed,
+    ).start()
+    # 使用进程池时每个工作线程等待一个转录进程，否则在一个线程中依次转录
+    return Stage(
+        "transcribe",
+        profiled("transcribe", transcribe_task),
+        workers=transcribe_processes if resources["transcribe_pool"] is not None else 1,
+        queue_size=stage_queue_size,
+        next_stage=translate_stage,
+        on_error=stage_failed,
+    ).start()
+
+
+def process_files(input_paths, output_paths, status=None, dst_langs=None):
+    """
+    处理一批文件，阻塞直到全部完成
+
+    :param input_paths: 音视频文件路径列表
+    :param output_paths: 对应的输出相对路径列表，不含扩展名
+    :param status: 状态回调 status(input_path, stage, error)，stage 见 report
+    :param dst_langs: 目标语言列表，为 None 时使用配置中的 dst_lang
+    """
+    transcribe_stage = start_stages()
+    try:
+        for input_path, output_path in zip(input_paths, output_paths):
+            item = {"input_path": input_path, "output_path": output_path, "dst_langs": dst_langs}
+            if status is not None:
+                item["status"] = lambda stage, error=None, path=input_path: status(path, stage, error)
+            # 队列已满时在此等待
+            transcribe_stage.put(item)
+        # 等待所有阶段处理完毕
+        transcribe_stage.close()
+    finally:
+        close_transcribe_pool()
+    flush_metrics()
+
+
+def run():
+    # 选择文件夹的对话框需要 tkinter，只在交互运行时导入
+    from base.path_request import Directory
+    src_dir = Directory("选择视频文件所在文件夹")
+    input_paths, output_paths = Files(
+        src_dir,
+        "",
+        extensions=media_extensions,
+        mkdir=False,
+    )
+    # 去除路径的扩展名
+    output_paths = [os.path.splitext(output_path)[0] for output_path in output_paths]
+    process_files(input_paths, output_paths)
@@ -0,0 +1,89 @@
+import math
+
+import pytest
+
+media_transcribe = pytest.importorskip("base.media_transcribe")
+from base.transcript_store import ColumnarTranscript
+
+
+def make_aligned():
+    # 第一条开头缺失、第二条中间连续缺失、第三条结尾缺失
+    return {
+        "segments": [
+            {
+                "start": 0.0,
+                "end": 3.0,
+                "text": " one two three",
+                "words": [{"word": "one"}, {"word": "two", "start": 1.0, "end": 1.5}, {"word": "three", "start": 2.0, "end": 3.0}],
+            },
+            {
+                "start": 4.0,
+                "end": 8.0,
+                "text": " four five six seven",
+                "words": [
+                    {"word": "four", "start": 4.0, "end": 4.5},
+                    {"word": "five"},
+                    {"word": "six"},
+                    {"word": "seven", "start": 7.0, "end": 8.0},
+                ],
+            },
+            {
+                "start": 9.0,
+                "end": 11.0,
+                "text": " eight nine",
+                "words": [{"word": "eight", "start": 9.0, "end": 9.5}, {"word": "nine"}],
+            },
+        ]
+    }
+
+
+class FakeWhisper:
+    def transcribe(self, audio, language, batch_size):
+        return {"segments": [{"start": 0.0, "end": 11.0, "text": " one two three"}], "language": language}
+
+
+@pytest.fixture
+def fake_align(monkeypatch):
+    monkeypatch.setattr(media_transcribe.wsx, "load_audio", lambda path: path)
+    monkeypatch.setattr(media_transcribe.wsx, "align", lambda *args, **kwargs: make_aligned())
+
+
+def run_batch(columnar):
+    return media_transcribe.transcribe_batch(
+        "audio.wav", "cpu", FakeWhisper(), None, None, batch_size=4, language="en", columnar=columnar
+    )
+
+
+def test_transcribe_batch_columnar_matches_dict(fake_align, monkeypatch):
+    calls = []
+    vectorized = media_transcribe.fill_missing_times_arrays
+
+    def spy(*args):
+        calls.append(args)
+        return vectorized(*args)
+
+    monkeypatch.setattr(media_transcribe, "fill_missing_times_arrays", spy)
+    _, plain = run_batch(columnar=False)
+    assert not calls
+    _, columnar = run_batch(columnar=True)
+    assert len(calls) == 1
+    assert isinstance(columnar, ColumnarTranscript)
+
+    result = columnar.to_dict()
+    assert len(result["segments"]) == len(plain["segments"])
+    for segment, expected in zip(result["segments"], plain["segments"]):
+        assert segment["text"] == expected["text"]
+        for word, expected_word in zip(segment["words"], expected["words"]):
+            assert word["word"] == expected_word["word"]
+            assert math.isclose(word["start"], expected_word["start"])
+            assert math.isclose(word["end"], expected_word["end"])
+
+
+def test_transcribe_batch_fills_every_word(fake_align):
+    _, aligned = run_batch(columnar=True)
+    for segment in aligned["segments"]:
+        for word in segment["words"]:
+            assert not math.isnan(word["start"]) and not math.isnan(word["end"])
+    # 连续缺失的两个词与它们之后的间隔一起，均分前后单词之间的时间
+    five, six = aligned["segments"][1]["words"][1], aligned["segments"][1]["words"][2]
+    assert math.isclose(five["start"], 4.5) and math.isclose(six["end"], 4.5 + 2 * 2.5 / 3)
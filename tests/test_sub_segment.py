@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+sub_segment = pytest.importorskip("base.sub_segment")
+from bench.synthetic import make_transcript, make_llm_pieces
+
+
+# 手写的边界情况：重叠、缺字、改字、重复片段、顺序错乱、空片段
+handwritten = [
+    ("hello world", ["hello ", "world"]),
+    ("hello world", ["hello wor", "lo world"]),
+    ("hello world", ["helo ", "wrld"]),
+    ("hello world", ["hxllo ", "wozld"]),
+    ("the cat and the cat", ["the cat ", "and ", "the cat"]),
+    ("the cat and the cat", ["the cat", "the cat"]),
+    ("abc def ghi", ["ghi", "abc "]),
+    ("abc def ghi", ["def"]),
+    ("abc def ghi", ["", "abc def ghi"]),
+    ("abc def ghi", ["abc def ghi", ""]),
+    ("我们今天讨论相对论", ["我们今天", "讨论相对论"]),
+    ("我们今天讨论相对论", ["我们今天讨", "天讨论相对论"]),
+    ("a", ["a"]),
+    ("aaaa", ["aa", "aa"]),
+    ("", [""]),
+]
+
+# 两种实现都会抛出异常的输入：片段比原字符串长、没有片段
+raising = [
+    ("hello", ["hello world"]),
+    ("", ["a"]),
+    ("hello world", ["hello ", "world!!!!!!!"]),
+    ("hello world", []),
+]
+
+
+def synthetic_corpus():
+    corpus = []
+    for cjk_ratio, seed in [(0.0, 0), (0.3, 1), (1.0, 2)]:
+        transcript = make_transcript(segments=60, words_per_segment=20, cjk_ratio=cjk_ratio, seed=seed)
+        rng = random.Random(seed)
+        for segment in transcript["segments"]:
+            for word_limit in (4, 8):
+                corpus.append((segment["text"], make_llm_pieces(rng, segment["text"], word_limit)))
+    return corpus
+
+
+def outcome(func, text, pieces):
+    try:
+        return func(text, list(pieces))
+    except Exception as exc:
+        return type(exc)
+
+
+@pytest.mark.parametrize("text,pieces", handwritten + raising)
+def test_align_segments_matches_reference(text, pieces):
+    expected = outcome(sub_segment.align_segments_reference, text, pieces)
+    assert outcome(sub_segment.align_segments, text, pieces) == expected
+
+
+@pytest.mark.parametrize("text,pieces", raising)
+def test_align_segments_raises_like_reference(text, pieces):
+    with pytest.raises(IndexError):
+        sub_segment.align_segments_reference(text, pieces)
+    with pytest.raises(IndexError):
+        sub_segment.align_segments(text, pieces)
+
+
+def test_align_segments_matches_reference_on_synthetic_corpus():
+    corpus = synthetic_corpus()
+    assert corpus
+    for text, pieces in corpus:
+        expected = sub_segment.align_segments_reference(text, pieces)
+        assert sub_segment.align_segments(text, pieces) == expected
+        assert "".join(expected) == text
@@ -0,0 +1,72 @@
+from base.sub_split import split_local
+
+
+def timed_words(text, pauses):
+    """
+    按空格分词并生成时间戳，pauses 为 {词序号: 该词之后的停顿秒数}
+    """
+    words = []
+    current = 0.0
+    for i, token in enumerate(text.split(" ")):
+        words.append({"word": token, "start": current, "end": current + 0.3})
+        current += 0.3 + pauses.get(i, 0.0)
+    return words
+
+
+def test_split_local_keeps_short_text():
+    text = "one two three"
+    assert split_local(text, None, 5) == [text]
+
+
+def test_split_local_breaks_after_punctuation():
+    text = "one two three four five. six seven eight nine ten"
+    assert split_local(text, None, 6) == ["one two three four five. ", "six seven eight nine ten"]
+
+
+def test_split_local_breaks_at_pause():
+    text = "one two three four five six seven eight nine ten"
+    # 第四个词之后停顿 0.8 秒，比均分位置更有把握
+    pieces = split_local(text, timed_words(text, {3: 0.8}), 6)
+    assert pieces == ["one two three four ", "five six seven eight nine ten"]
+
+
+def test_split_local_prefers_pause_over_even_split():
+    text = "one two three four five six seven eight nine ten eleven twelve"
+    pieces = split_local(text, timed_words(text, {4: 1.0, 8: 1.0}), 5)
+    assert pieces == ["one two three four five ", "six seven eight nine ", "ten eleven twelve"]
+
+
+def test_split_local_ignores_mismatched_timestamps():
+    text = "one two three four five six seven eight nine ten"
+    words = timed_words(text, {3: 0.8})
+    words[0]["word"] = "uno"
+    assert split_local(text, words, 6) is None
+
+
+def test_split_local_threshold_cutoff():
+    # 逗号得 0.7 分
+    text = "one two three four five, six seven eight nine ten"
+    expected = ["one two three four five, ", "six seven eight nine ten"]
+    assert split_local(text, None, 6) == expected
+    assert split_local(text, None, 6, threshold=0.7) == expected
+    assert split_local(text, None, 6, threshold=0.8) is None
+
+    # 0.3 秒停顿约得 0.6 分
+    plain = "one two three four five six seven eight nine ten"
+    words = timed_words(plain, {4: 0.3})
+    assert split_local(plain, words, 6, threshold=0.55) == ["one two three four five ", "six seven eight nine ten"]
+    assert split_local(plain, words, 6, threshold=0.65) is None
+
+
+def test_split_local_returns_none_without_break():
+    text = "one two three four five six seven eight nine ten"
+    assert split_local(text, None, 6) is None
+    assert split_local(text, timed_words(text, {}), 6) is None
+
+
+def test_split_local_pieces_rebuild_text():
+    text = "  first part here. second part, with more words; third part goes on and on.  "
+    pieces = split_local(text, None, 6)
+    assert pieces is not None
+    assert "".join(pieces) == text
+    assert all(len(piece.split()) <= 6 for piece in pieces)